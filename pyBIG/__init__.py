@@ -1,9 +1,27 @@
+from .async_archive import AsyncArchive
 from .disk_archive import InDiskArchive
 from .memory_archive import InMemoryArchive
+from .merge import merge_archives
+from .observer import ArchiveObserver, LoggingObserver
+from .stream import ArchiveWriter, iter_archive
+from .volumes import VolumeSet, open_volume_set
 
 Archive = InMemoryArchive
 LargeArchive = InDiskArchive
 
-__version__ = "0.6.6"
+__version__ = "0.7.0"
 
-__all__ = ["InMemoryArchive", "InDiskArchive", "Archive", "LargeArchive"]
+__all__ = [
+    "InMemoryArchive",
+    "InDiskArchive",
+    "AsyncArchive",
+    "ArchiveObserver",
+    "LoggingObserver",
+    "ArchiveWriter",
+    "iter_archive",
+    "merge_archives",
+    "VolumeSet",
+    "open_volume_set",
+    "Archive",
+    "LargeArchive",
+]
@@ -0,0 +1,230 @@
+import asyncio
+import contextlib
+import functools
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Iterable, List, Tuple
+
+from .base_archive import (
+    ArchiveDiff,
+    BaseArchive,
+    CompressionReport,
+    Entry,
+    SyncReport,
+    UpdateReport,
+    VerifyReport,
+)
+
+
+class AsyncArchive:
+    """Wrapper allowing an archive to be used from asyncio code without blocking
+    the event loop. Disk reads, modifications and repacks run on a dedicated
+    executor, since modifying an InDiskArchive can spool or save it.
+
+    Reads can run concurrently with each other while mutations are serialised
+    and wait for ongoing reads to finish. Reads started while a mutation is
+    waiting or running wait for it to complete.
+
+    Params
+    -------
+    archive : BaseArchive
+        The archive to wrap
+    executor : Optional[Executor]
+        The executor to run blocking operations on. If omitted a thread pool
+        is created and shut down with AsyncArchive.close
+    max_workers : Optional[int]
+        Maximum number of threads of the created thread pool
+    """
+
+    def __init__(
+        self, archive: BaseArchive, *, executor: Executor = None, max_workers: int = None
+    ):
+        self.archive = archive
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="pyBIG"
+        )
+
+        # created lazily so they are bound to the running loop
+        self._lock = None
+        self._condition = None
+        self._readers = 0
+        self._writing = False
+
+    def __repr__(self):
+        return f"< AsyncArchive archive={self.archive!r} >"
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        # waiting for queued repacks and saves must not block the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    def close(self):
+        """Shut down the executor if it was created by the wrapper, waiting for
+        the operations already queued. Leaving an async with block does the same
+        without blocking the event loop.
+        """
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        """Lock held for the whole duration of a mutation"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        return self._lock
+
+    def _get_condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+
+        return self._condition
+
+    @contextlib.asynccontextmanager
+    async def _reading(self) -> AsyncIterator[None]:
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: not self._writing)
+            self._readers += 1
+
+        try:
+            yield
+        finally:
+            async with condition:
+                self._readers -= 1
+                condition.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def _writing_lock(self) -> AsyncIterator[None]:
+        condition = self._get_condition()
+        async with self.lock:
+            try:
+                async with condition:
+                    # block new readers first so a stream of reads cannot starve the writer
+                    self._writing = True
+                    await condition.wait_for(lambda: self._readers == 0)
+
+                yield
+            finally:
+                async with condition:
+                    self._writing = False
+                    condition.notify_all()
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def _read(self, func, *args, **kwargs):
+        async with self._reading():
+            return await self._run(func, *args, **kwargs)
+
+    async def _write(self, func, *args, **kwargs):
+        async with self._writing_lock():
+            return await self._run(func, *args, **kwargs)
+
+    async def file_exists(self, name: str) -> bool:
+        """See BaseArchive.file_exists"""
+        async with self._reading():
+            return self.archive.file_exists(name)
+
+    async def file_list(self) -> List[str]:
+        """See BaseArchive.file_list"""
+        async with self._reading():
+            return self.archive.file_list()
+
+    async def get_file_entry(self, name: str) -> Entry:
+        """See BaseArchive.get_file_entry"""
+        async with self._reading():
+            return self.archive.get_file_entry(name)
+
+    async def read_file(self, name: str) -> bytes:
+        """See BaseArchive.read_file"""
+        return await self._read(self.archive.read_file, name)
+
+    async def read_files(self, names: Iterable[str], **kwargs) -> Dict[str, bytes]:
+        """See BaseArchive.read_files"""
+        return await self._read(self.archive.read_files, names, **kwargs)
+
+    async def file_hash(self, name: str, algorithm: str = "crc32") -> str:
+        """See BaseArchive.file_hash"""
+        return await self._read(self.archive.file_hash, name, algorithm)
+
+    async def file_hashes(
+        self, names: Iterable[str] = None, algorithm: str = "crc32", **kwargs
+    ) -> Dict[str, str]:
+        """See BaseArchive.file_hashes"""
+        return await self._read(self.archive.file_hashes, names, algorithm, **kwargs)
+
+    async def diff(self, other: BaseArchive, **kwargs) -> ArchiveDiff:
+        """See BaseArchive.diff"""
+        return await self._read(self.archive.diff, other, **kwargs)
+
+    async def verify(self, **kwargs) -> VerifyReport:
+        """See BaseArchive.verify"""
+        return await self._read(self.archive.verify, **kwargs)
+
+    async def search(self, pattern, **kwargs) -> List[Tuple[str, int]]:
+        """See BaseArchive.search, every match is returned at once"""
+        return await self._read(list, self.archive.search(pattern, **kwargs))
+
+    async def analyze_compression(self, **kwargs) -> CompressionReport:
+        """See BaseArchive.analyze_compression"""
+        return await self._read(self.archive.analyze_compression, **kwargs)
+
+    async def extract(self, output: str, **kwargs):
+        """See BaseArchive.extract"""
+        return await self._read(self.archive.extract, output, **kwargs)
+
+    async def sync_to(self, output: str, **kwargs) -> SyncReport:
+        """See BaseArchive.sync_to"""
+        return await self._read(self.archive.sync_to, output, **kwargs)
+
+    async def add_file(self, name: str, content: bytes):
+        """See BaseArchive.add_file"""
+        return await self._write(self.archive.add_file, name, content)
+
+    async def edit_file(self, name: str, content: bytes):
+        """See BaseArchive.edit_file"""
+        return await self._write(self.archive.edit_file, name, content)
+
+    async def remove_file(self, name: str):
+        """See BaseArchive.remove_file"""
+        return await self._write(self.archive.remove_file, name)
+
+    async def copy_file(self, name: str, new_name: str):
+        """See BaseArchive.copy_file"""
+        return await self._write(self.archive.copy_file, name, new_name)
+
+    async def rename_file(self, name: str, new_name: str):
+        """See BaseArchive.rename_file"""
+        return await self._write(self.archive.rename_file, name, new_name)
+
+    async def move_dir(self, prefix: str, new_prefix: str) -> Dict[str, str]:
+        """See BaseArchive.move_dir"""
+        return await self._write(self.archive.move_dir, prefix, new_prefix)
+
+    async def update_from_directory(self, path: str, **kwargs) -> UpdateReport:
+        """See BaseArchive.update_from_directory"""
+        return await self._write(self.archive.update_from_directory, path, **kwargs)
+
+    async def repack(self, **kwargs):
+        """See BaseArchive.repack"""
+        return await self._write(self.archive.repack, **kwargs)
+
+    async def recompress(self, selection: Iterable, **kwargs) -> Dict[str, int]:
+        """See BaseArchive.recompress"""
+        return await self._write(self.archive.recompress, selection, **kwargs)
+
+    async def save(self, *args, **kwargs):
+        """See BaseArchive.save"""
+        return await self._write(self.archive.save, *args, **kwargs)
+
+    async def save_volumes(self, path: str, **kwargs) -> List[str]:
+        """See BaseArchive.save_volumes"""
+        return await self._read(self.archive.save_volumes, path, **kwargs)
+
+    async def bytes(self) -> bytes:
+        """See BaseArchive.bytes"""
+        return await self._write(self.archive.bytes)
@@ -1,15 +1,52 @@
 import enum
+import fnmatch
+import hashlib
+import json
 import logging
 import os
+import re
 import struct
+import time
+import zlib
 from collections import namedtuple
-from typing import IO, Dict, List, Optional, Tuple, Type, TypeVar
-
-Entry = namedtuple("Entry", "name position size")
-EntryEdit = namedtuple("EntryEdit", "name action content size")
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import IO, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Type, TypeVar
+
+from . import vectorized
+from .entry_table import Entry, EntryTable
+from .observer import ArchiveObserver, observe_phase
+from .refpack import compress, decompress, has_refpack_header
+
+# source is the name of the stored file whose data is reused by an index-only edit
+EntryEdit = namedtuple("EntryEdit", "name action content size source", defaults=(None,))
+ArchiveDiff = namedtuple("ArchiveDiff", "added removed changed")
+SyncReport = namedtuple("SyncReport", "written deleted")
+UpdateReport = namedtuple("UpdateReport", "added edited removed")
+VerifyReport = namedtuple(
+    "VerifyReport", "header_error size_mismatch out_of_bounds overlapping duplicates corrupt"
+)
+CompressionReport = namedtuple(
+    "CompressionReport", "compressed compressed_size candidates extensions"
+)
+CompressionCandidate = namedtuple("CompressionCandidate", "name size saved seconds")
+CompressionEstimate = namedtuple("CompressionEstimate", "files size ratio seconds_per_mb")
 FileList = List[Tuple[str, int, Optional[int]]]
 T = TypeVar("T", bound="BaseArchive")
 
+# files closer than this on disk are read at once by BaseArchive.iter_files
+READ_GAP = 64 * 1024
+# coalesced reads stop growing past this size
+MAX_READ_SIZE = 16 * 1024 * 1024
+# largest archive supported by the BIG format
+MAX_VOLUME_SIZE = 0xFFFFFFFF
+# files are sent to the search processes in batches of about this size
+SEARCH_BATCH_SIZE = 1024 * 1024
+# only the start of the files is compressed to estimate compression ratios
+SAMPLE_SIZE = 64 * 1024
+# refpack stores the uncompressed size on three bytes
+REFPACK_MAX_SIZE = 0xFFFFFF
+
 
 class FileAction(enum.Enum):
     ADD = 0
@@ -20,14 +57,101 @@ class MaxSizeError(Exception):
     pass
 
 
+def hash_data(data: bytes, algorithm: str = "crc32") -> str:
+    """Compute the hex digest of some data.
+
+    Params
+    -------
+    data : bytes
+        The data to hash
+    algorithm : str
+        Either crc32 or the name of any algorithm supported by hashlib,
+        such as blake2b. Defaults to crc32
+
+    Returns
+    --------
+    str
+        The hex digest
+    """
+    if algorithm == "crc32":
+        return format(zlib.crc32(data) & 0xFFFFFFFF, "08x")
+
+    return hashlib.new(algorithm, data).hexdigest()
+
+
+def _hash_local_file(path: str, algorithm: str) -> str:
+    with open(path, "rb") as f:
+        return hash_data(f.read(), algorithm)
+
+
+def _check_refpack(data: bytes) -> Optional[str]:
+    """Try to decompress refpack data, returning the error if it fails"""
+    try:
+        decompress(data)
+    except (ValueError, IndexError) as e:
+        return str(e) or type(e).__name__
+
+    return None
+
+
+def _search_batch(
+    pattern: "re.Pattern[bytes]", batch: List[Tuple[str, bytes]]
+) -> List[Tuple[str, int]]:
+    """Find the offsets of every match of a pattern in a batch of files, files
+    with a refpack header are searched once decompressed.
+    """
+    matches = []
+    for name, data in batch:
+        if has_refpack_header(data):
+            try:
+                data = decompress(data)
+            except (ValueError, IndexError):
+                pass
+
+        matches.extend((name, match.start()) for match in pattern.finditer(data))
+
+    return matches
+
+
+def _sample_compression(data: bytes) -> Tuple[int, float]:
+    """Compress data, returning the compressed size and the time it took"""
+    start = time.perf_counter()
+    size = len(compress(data))
+    return size, time.perf_counter() - start
+
+
+def _extension(name: str) -> str:
+    return os.path.splitext(name.rpartition("\\")[2])[1].lower()
+
+
+def _walk_directory(path: str) -> Iterable[Tuple[str, str]]:
+    """Yield the archive name and the path of every file in a directory"""
+    for dir_name, _, file_list in os.walk(path):
+        for filename in file_list:
+            file_path = os.path.join(dir_name, filename)
+            yield os.path.relpath(file_path, path).replace(os.sep, "\\"), file_path
+
+
 class BaseArchive:
     modified_entries: Dict[str, EntryEdit]
-    entries: Dict[str, Entry]
+    entries: Mapping[str, Entry]
+    # digests of the stored data, keyed by (position, size) then by algorithm
+    _hash_cache: Dict[Tuple[int, int], Dict[str, str]]
+    # total size of the content of the pending modified entries
+    _pending_bytes: int
+    observer: Optional[ArchiveObserver] = None
+    # names of the files read since BaseArchive.start_trace, in order of first read
+    _access_trace: Optional[Dict[str, None]] = None
 
     @staticmethod
-    def _unpack(file: IO) -> Tuple[List[Entry], str]:
+    def _unpack(file: IO, observer: ArchiveObserver = None) -> Tuple[EntryTable, str]:
         """Get a list of files in the big"""
-        entries = {}
+        with observe_phase(observer, "unpack"):
+            return BaseArchive._unpack_index(file)
+
+    @staticmethod
+    def _unpack_index(file: IO) -> Tuple[EntryTable, str]:
+        """Parse the header and index of the big"""
         file.seek(0)
 
         # header
@@ -40,23 +164,22 @@ class BaseArchive:
         logging.info(f"index size: {index_size}")
 
         index_data = file.read(index_size)
-        buf = memoryview(index_data)
+        if vectorized.available(archive_count):
+            entries = vectorized.unpack_index(index_data, archive_count)
+            if entries is not None:
+                return entries, header
+
         offset = 0
         entry_struct = struct.Struct(">II")
+        entries = EntryTable()
 
         for _ in range(archive_count):
-            position, entry_size = entry_struct.unpack_from(buf, offset)
+            position, entry_size = entry_struct.unpack_from(index_data, offset)
             offset += entry_struct.size
 
-            end = buf[offset:].tobytes().find(b"\x00")
-            name = buf[offset : offset + end].tobytes().decode("latin-1")
-            offset += end + 1
-
-            logging.debug(f"name: {name}")
-            logging.debug(f"position: {position}")
-            logging.debug(f"file size: {entry_size}")
-
-            entries[name] = Entry(name, position, entry_size)
+            end = index_data.index(b"\x00", offset)
+            entries._insert(index_data[offset:end], position, entry_size)
+            offset = end + 1
 
         return entries, header
 
@@ -72,8 +195,7 @@ class BaseArchive:
         for name in self.file_list():
             if name in self.modified_entries:
                 entry = self.modified_entries[name]
-                entry_size = len(entry.content)
-                logging.info(f"applying change from modified entries for {name}")
+                entry_size = entry.size
             else:
                 entry = self.entries[name]
                 entry_size = entry.size
@@ -85,16 +207,19 @@ class BaseArchive:
         file_list.sort(key=lambda x: x[0])
         return file_list, total_size, file_count
 
+    @staticmethod
     def _pack_file_list(
-        self,
         archive_file: IO,
         file_list: List[Tuple[str, int]],
         total_size: int,
         file_count: int,
         header: str,
+        layout: List[Tuple[str, int]] = None,
     ):
-        """Index the files and append the raw data to create a complete archive"""
-        entries = {}
+        """Index the files and append the raw data to create a complete archive. The
+        data is laid out in the order of the file list unless another layout is given.
+        """
+        entries = None
 
         # header, charstring, 4 bytes - always BIG4 or something similiar
         archive_file.write(header.encode("utf-8"))
@@ -122,44 +247,90 @@ class BaseArchive:
         logging.info(f"index size: {first_entry}")
         archive_file.write(struct.pack(">I", first_entry))
 
+        offsets = None
+        if layout is not None:
+            starts = {}
+            position = 0
+            for name, file_size in layout:
+                starts[name] = position
+                position += file_size
+            offsets = [starts[name] for name, _ in file_list]
+
+        logging.info("packing file list...")
+        if vectorized.available(file_count):
+            index_data, entries = vectorized.pack_index(file_list, first_entry, offsets)
+            if entries is not None:
+                archive_file.write(index_data)
+
+        if entries is None:
+            entries = BaseArchive._pack_entries(archive_file, file_list, first_entry, offsets)
+
+        # not sure what's this but I think we need it see:
+        # https://github.com/chipgw/openbfme/blob/master/bigreader/bigarchive.cpp
+        archive_file.write(b"L253")
+        archive_file.write(b"\0")
+        logging.info("DONE packing file list")
+
+        return entries
+
+    @staticmethod
+    def _pack_entries(
+        archive_file: IO,
+        file_list: List[Tuple[str, int]],
+        first_entry: int,
+        offsets: List[int] = None,
+    ) -> EntryTable:
+        """Write the entries of the index one at a time"""
+        entries = EntryTable()
+
         # Put the first file one byte after the end of the header.
         position = 1
 
-        logging.info("packing file list...")
         entry_struct = struct.Struct(">II")
-        for file in file_list:
+        for row, file in enumerate(file_list):
+            if offsets is not None:
+                position = offsets[row] + 1
+
             # position of embedded file within BIG-file, unsigned integer, 4 bytes, big endian byte order
             # size of embedded data, unsigned integer, 4 bytes, big endian byte order
-            logging.debug("packing %s", file[0])
             pos_size = entry_struct.pack(first_entry + position, file[1])
 
             # file name, cstring, ends with null byte
-            name = file[0].encode("latin-1") + b"\x00"
-            archive_file.write(pos_size + name)
+            name = file[0].encode("latin-1")
+            archive_file.write(pos_size + name + b"\x00")
 
-            entries[file[0]] = Entry(file[0], first_entry + position, file[1])
+            entries._insert(name, first_entry + position, file[1])
 
             position += file[1]
 
-        # not sure what's this but I think we need it see:
-        # https://github.com/chipgw/openbfme/blob/master/bigreader/bigarchive.cpp
-        archive_file.write(b"L253")
-        archive_file.write(b"\0")
-        logging.info("DONE packing file list")
-
         return entries
 
+    @staticmethod
+    def _layout(file_list: FileList, order: Optional[Iterable[str]]) -> Optional[FileList]:
+        """Order the data of the files, the files in order come first in that
+        order and the others follow in the order of the file list.
+        """
+        if order is None:
+            return None
+
+        sizes = dict(file_list)
+        layout = [(name, sizes[name]) for name in dict.fromkeys(order) if name in sizes]
+        placed = {name for name, _ in layout}
+        layout.extend(file for file in file_list if file[0] not in placed)
+        return layout
+
     @staticmethod
     def _pack_archive_from_directory(archive: T, path: str) -> T:
         logging.info("building archive from folder")
-        for dir_name, _, file_list in os.walk(path):
-            for filename in file_list:
-                file_path = os.path.join(dir_name, filename)
-                name = file_path.replace(path, "")[1:].replace("/", "\\")
-
+        observer = archive.observer
+        with observe_phase(observer, "from_directory"):
+            for name, file_path in _walk_directory(path):
                 with open(file_path, "rb") as f:
-                    logging.debug("adding %s", name)
-                    archive.add_file(name, f.read())
+                    content = f.read()
+
+                archive.add_file(name, content)
+                if observer is not None:
+                    observer.entry("from_directory", name, len(content))
 
         archive._pack()
         logging.info("done building archive from folder")
@@ -258,11 +429,112 @@ class BaseArchive:
         if not self.file_exists(name):
             raise KeyError(f"File '{name}' does not exist.")
 
+        if self._access_trace is not None:
+            self._access_trace.setdefault(name)
+
         if name in self.modified_entries:
-            return self.modified_entries[name].content
+            return self._read_pending(name)
 
         return self._get_file(name)
 
+    def read_files(self, names: Iterable[str], *, gap: int = READ_GAP) -> Dict[str, bytes]:
+        """Get the raw bytes of several files at once, see BaseArchive.iter_files
+
+        Params
+        -------
+        names : Iterable[str]
+            Names of the files
+        gap : int
+            Files separated by at most this many bytes are read at once
+
+        Returns
+        -------
+        Dict[str, bytes]
+            Mapping of file name to file bytes
+
+        Raises
+        ------
+            KeyError
+                File not found
+        """
+        return dict(self.iter_files(names, gap=gap))
+
+    def iter_files(
+        self, names: Iterable[str] = None, *, gap: int = READ_GAP
+    ) -> Iterator[Tuple[str, bytes]]:
+        """Iterate over the raw bytes of several files. Pending modified entries
+        come first, then the files stored in the archive in the order they are
+        stored on disk. Files close to each other are read together in a single
+        read, turning many small random reads into a few large sequential ones.
+
+        Params
+        -------
+        names : Optional[Iterable[str]]
+            Names of the files, defaults to every file in the archive
+        gap : int
+            Files separated by at most this many bytes are read at once, the bytes
+            between them are read and discarded. Defaults to 64KiB, use -1 to
+            read every file separately
+
+        Returns
+        -------
+        Iterator[Tuple[str, bytes]]
+            The name and bytes of every file
+
+        Raises
+        ------
+            KeyError
+                File not found
+        """
+        if names is None:
+            names = self.file_list()
+
+        pending = []
+        stored = []
+        for name in dict.fromkeys(names):
+            if not self.file_exists(name):
+                raise KeyError(f"File '{name}' does not exist.")
+
+            entry = self._stored_entry(name)
+            if entry is None:
+                pending.append(name)
+            else:
+                stored.append(entry)
+
+        for name in pending:
+            yield name, self._read_pending(name)
+
+        yield from self._iter_entries(stored, gap)
+
+    def _iter_entries(
+        self, entries: List[Entry], gap: int = READ_GAP
+    ) -> Iterator[Tuple[str, bytes]]:
+        """Read the stored data of entries in the order it is stored, coalescing
+        the reads of entries close to each other, see BaseArchive.iter_files
+        """
+        entries = sorted(entries, key=lambda entry: (entry.position, entry.size))
+        groups: List[Tuple[int, int, List[Entry]]] = []
+        for entry in entries:
+            end = entry.position + entry.size
+            if groups:
+                start, group_end, members = groups[-1]
+                if (
+                    entry.position - group_end <= gap
+                    and max(end, group_end) - start <= MAX_READ_SIZE
+                ):
+                    groups[-1] = (start, max(end, group_end), members)
+                    members.append(entry)
+                    continue
+
+            groups.append((entry.position, end, [entry]))
+
+        ranges = [(start, end - start) for start, end, _ in groups]
+        for (start, _, members), data in zip(groups, self._read_ranges(ranges)):
+            view = memoryview(data)
+            for entry in members:
+                offset = entry.position - start
+                yield entry.name, bytes(view[offset : offset + entry.size])
+
     def add_file(self, name: str, content: bytes):
         """Mark a file to be added. This does not modify the archive itself yet.
         You need to call Archive.repack for the archive to be actually modified.
@@ -290,7 +562,7 @@ class BaseArchive:
         if "/" in name:
             raise ValueError(f"File '{name}' cannot contain '/', use '\\' instead.")
 
-        self.modified_entries[name] = EntryEdit(name, FileAction.ADD, content, len(content))
+        self._modify(EntryEdit(name, FileAction.ADD, content, len(content)))
 
     def edit_file(self, name: str, content: bytes):
         """Edit an existing file with new content. This does not actually modify
@@ -312,7 +584,7 @@ class BaseArchive:
         if not self.file_exists(name):
             raise KeyError(f"File '{name}' does not exist.")
 
-        self.modified_entries[name] = EntryEdit(name, FileAction.ADD, content, len(content))
+        self._modify(EntryEdit(name, FileAction.ADD, content, len(content)))
 
     def remove_file(self, name: str):
         """Mark as existing file for deletion. The deletion will only happen once
@@ -331,7 +603,116 @@ class BaseArchive:
         if not self.file_exists(name):
             raise KeyError(f"File '{name}' does not exist.")
 
-        self.modified_entries[name] = EntryEdit(name, FileAction.REMOVE, None, 0)
+        self._modify(EntryEdit(name, FileAction.REMOVE, None, 0))
+
+    def copy_file(self, name: str, new_name: str):
+        """Mark a file to be copied to a new name. Only the index is modified,
+        both files keep pointing at the same data until the archive is repacked
+        which stores the data once for each of them.
+
+        Params
+        -------
+        name : str
+            Name of the file, usually something like data\\ini\\weapon.ini
+        new_name : str
+            Name of the copy
+
+        Raises
+        ------
+            KeyError
+                File not found or new file already exists
+            ValueError
+                New file name contains forbidden characters
+        """
+        if not self.file_exists(name):
+            raise KeyError(f"File '{name}' does not exist.")
+
+        if self.file_exists(new_name):
+            raise KeyError(f"File '{new_name}' already exists.")
+
+        if "/" in new_name:
+            raise ValueError(f"File '{new_name}' cannot contain '/', use '\\' instead.")
+
+        self._modify(self._copy_edit(name, new_name))
+
+    def rename_file(self, name: str, new_name: str):
+        """Mark a file to be renamed. Only the index is modified, the data of the
+        file is not read.
+
+        Params
+        -------
+        name : str
+            Name of the file, usually something like data\\ini\\weapon.ini
+        new_name : str
+            New name of the file
+
+        Raises
+        ------
+            KeyError
+                File not found or new file already exists
+            ValueError
+                New file name contains forbidden characters
+        """
+        self.copy_file(name, new_name)
+        self.remove_file(name)
+
+    def move_dir(self, prefix: str, new_prefix: str) -> Dict[str, str]:
+        """Mark every file of a directory to be moved to another directory.
+        Only the index is modified, the data of the files is not read.
+
+        Params
+        -------
+        prefix : str
+            The directory to move, usually something like data\\ini
+        new_prefix : str
+            The new directory
+
+        Returns
+        --------
+        Dict[str, str]
+            Mapping of the old names of the files to their new names
+
+        Raises
+        ------
+            KeyError
+                A file already exists in the new directory
+            ValueError
+                New directory name contains forbidden characters
+        """
+        if "/" in new_prefix:
+            raise ValueError(f"Directory '{new_prefix}' cannot contain '/', use '\\' instead.")
+
+        prefix = prefix.rstrip("\\") + "\\"
+        new_prefix = new_prefix.rstrip("\\") + "\\"
+        moved = {
+            name: new_prefix + name[len(prefix) :]
+            for name in self.file_list()
+            if name.startswith(prefix)
+        }
+
+        for new_name in moved.values():
+            if new_name not in moved and self.file_exists(new_name):
+                raise KeyError(f"File '{new_name}' already exists.")
+
+        edits = [self._copy_edit(name, new_name) for name, new_name in moved.items()]
+        for name in moved:
+            self.remove_file(name)
+
+        for edit in edits:
+            self._modify(edit)
+
+        return moved
+
+    def _copy_edit(self, name: str, new_name: str) -> EntryEdit:
+        """Edit giving new_name the content of name, reusing the stored data if possible"""
+        edit = self.modified_entries.get(name)
+        if edit is None:
+            return EntryEdit(new_name, FileAction.ADD, None, self.entries[name].size, name)
+
+        if edit.source is not None:
+            return edit._replace(name=new_name)
+
+        return EntryEdit(new_name, FileAction.ADD, self._read_pending(name), edit.size)
 
     def extract(self, output: str, *, files: List[str] = None):
         """Extract the contents of the archive to a folder.
@@ -346,9 +727,14 @@ class BaseArchive:
         if files is None:
             files = self.file_list()
 
-        for name in files:
-            file = self.read_file(name)
-            path = os.path.normpath(os.path.join(output, name).replace("\\", "/"))
+        with observe_phase(self.observer, "extract"):
+            self._copy_entries(self._extract_targets(output, self._storage_order(files)))
+
+    def _extract_targets(self, output: str, names: List[str]) -> Iterator[Tuple[str, IO]]:
+        """Open the output file of every file, closing it once the next one is needed"""
+        observer = self.observer
+        for name in names:
+            path = self._output_path(output, name)
 
             # create the directories if they don't exist.
             file_dir = os.path.dirname(path)
@@ -356,37 +742,977 @@ class BaseArchive:
                 os.makedirs(file_dir)
 
             with open(path, "wb") as f:
-                f.write(file)
+                yield name, f
+
+            if observer is not None:
+                observer.entry("extract", name, self.get_file_entry(name).size)
+
+    def _storage_order(self, names: Iterable[str]) -> List[str]:
+        """Sort files in the order their data is stored, pending files first
+
+        Raises
+        ------
+            KeyError
+                File not found
+        """
+        positions = {}
+        for name in dict.fromkeys(names):
+            if not self.file_exists(name):
+                raise KeyError(f"File '{name}' does not exist.")
+
+            entry = self._stored_entry(name)
+            positions[name] = -1 if entry is None else entry.position
+
+        return sorted(positions, key=positions.__getitem__)
+
+    def sync_to(
+        self,
+        output: str,
+        *,
+        delete: bool = False,
+        compare: str = "hash",
+        algorithm: str = "crc32",
+        workers: int = None,
+    ) -> SyncReport:
+        """Extract the contents of the archive to a folder, only writing the files
+        that differ from the ones already present. Files are first compared by size,
+        then either by hash or by modification time.
+
+        Files written from an archive saved on disk get the modification time of the
+        archive, the mtime comparison uses this to skip hashing files that were
+        synced from the same archive.
+
+        Params
+        -------
+        output : str
+            The folder to extract everything to
+        delete : bool
+            Remove the files in the folder that are not in the archive
+        compare : str
+            Either hash or mtime. Defaults to hash
+        algorithm : str
+            The algorithm used to compare files, see BaseArchive.file_hash.
+            Defaults to crc32
+        workers : Optional[int]
+            Maximum number of threads used for hashing
+
+        Returns
+        --------
+        SyncReport
+            The names of the files written and the paths of the files deleted
+        """
+        if compare not in ("hash", "mtime"):
+            raise ValueError(f"Unknown comparison '{compare}', use either 'hash' or 'mtime'")
+
+        mtime = self._archive_mtime()
+        written = []
+        candidates = []
+        paths = {}
+        for name in self.file_list():
+            path = paths[name] = self._output_path(output, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                written.append(name)
+                continue
+
+            if stat.st_size != self.get_file_entry(name).size:
+                written.append(name)
+            elif (
+                compare == "mtime"
+                and stat.st_mtime_ns == mtime
+                and name not in self.modified_entries
+            ):
+                continue
+            else:
+                candidates.append(name)
+
+        if candidates:
+            hashes = self.file_hashes(candidates, algorithm, workers=workers)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                local_hashes = executor.map(
+                    lambda name: _hash_local_file(paths[name], algorithm), candidates
+                )
+                for name, digest in zip(candidates, local_hashes):
+                    if digest != hashes[name]:
+                        written.append(name)
+                    elif mtime is not None and name not in self.modified_entries:
+                        os.utime(paths[name], ns=(mtime, mtime))
+
+        written.sort()
+        self.extract(output, files=written)
+        if mtime is not None:
+            for name in written:
+                if name not in self.modified_entries:
+                    os.utime(paths[name], ns=(mtime, mtime))
+
+        deleted = []
+        if delete:
+            expected = set(paths.values())
+            for dir_name, _, file_list in os.walk(output):
+                for filename in file_list:
+                    path = os.path.normpath(os.path.join(dir_name, filename))
+                    if path not in expected:
+                        os.remove(path)
+                        deleted.append(path)
+
+        logging.info(f"synced {len(written)} files, deleted {len(deleted)} files")
+        return SyncReport(written, sorted(deleted))
+
+    def _output_path(self, output: str, name: str) -> str:
+        """Path a file gets extracted to"""
+        return os.path.normpath(os.path.join(output, name).replace("\\", "/"))
+
+    def update_from_directory(
+        self,
+        path: str,
+        *,
+        remove: bool = True,
+        compare: str = "hash",
+        algorithm: str = "crc32",
+        workers: int = None,
+    ) -> UpdateReport:
+        """Mark the files of a directory that differ from the archive to be added
+        or edited, and the files missing from the directory to be removed. This is
+        the incremental equivalent of BaseArchive.from_directory, files are first
+        compared by size, then either by hash or by modification time (see
+        BaseArchive.sync_to). Unchanged files are never read from the directory.
+
+        Like the other edit methods, this does not modify the archive itself yet.
 
-    def repack(self):
+        Params
+        -------
+        path : str
+            Path to the top level folder of the files
+        remove : bool
+            Mark the files that are not in the directory for deletion. Defaults to True
+        compare : str
+            Either hash or mtime. Defaults to hash
+        algorithm : str
+            The algorithm used to compare files, see BaseArchive.file_hash.
+            Defaults to crc32
+        workers : Optional[int]
+            Maximum number of threads used for hashing
+
+        Returns
+        --------
+        UpdateReport
+            The names of the files added, edited and removed
+        """
+        if compare not in ("hash", "mtime"):
+            raise ValueError(f"Unknown comparison '{compare}', use either 'hash' or 'mtime'")
+
+        mtime = self._archive_mtime()
+        added = []
+        edited = []
+        candidates = []
+        paths = {}
+        for name, file_path in _walk_directory(path):
+            paths[name] = file_path
+            if not self.file_exists(name):
+                added.append(name)
+                continue
+
+            stat = os.stat(file_path)
+            if stat.st_size != self.get_file_entry(name).size:
+                edited.append(name)
+            elif (
+                compare == "mtime"
+                and stat.st_mtime_ns == mtime
+                and name not in self.modified_entries
+            ):
+                continue
+            else:
+                candidates.append(name)
+
+        if candidates:
+            hashes = self.file_hashes(candidates, algorithm, workers=workers)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                local_hashes = executor.map(
+                    lambda name: _hash_local_file(paths[name], algorithm), candidates
+                )
+                edited.extend(
+                    name
+                    for name, digest in zip(candidates, local_hashes)
+                    if digest != hashes[name]
+                )
+
+        for name in added:
+            with open(paths[name], "rb") as f:
+                logging.debug("adding %s", name)
+                self.add_file(name, f.read())
+
+        for name in edited:
+            with open(paths[name], "rb") as f:
+                logging.debug("editing %s", name)
+                self.edit_file(name, f.read())
+
+        removed = []
+        if remove:
+            removed = [name for name in self.file_list() if name not in paths]
+            for name in removed:
+                self.remove_file(name)
+
+        added.sort()
+        edited.sort()
+        logging.info(f"{len(added)} added, {len(edited)} edited, {len(removed)} removed")
+        return UpdateReport(added, edited, removed)
+
+    def repack(self, *, layout: Iterable[str] = None):
         """Update the archive to include all the modified entries. This clears
         the list and updates the archive with the new data.
+
+        Params
+        -------
+        layout : Optional[Iterable[str]]
+            Order in which to store the data of the files, such as the order the
+            game loads them in or a trace from BaseArchive.stop_trace. Files not
+            listed are stored after, the index is always sorted by name.
         """
-        self._pack()
+        self._pack(layout=layout)
+
+    def start_trace(self):
+        """Start recording the names of the files read with BaseArchive.read_file"""
+        self._access_trace = {}
+
+    def stop_trace(self) -> List[str]:
+        """Stop recording the files read, see BaseArchive.start_trace
+
+        Returns
+        --------
+        List[str]
+            The names of the files read since the trace started, in the order
+            they were first read. This can be passed as the layout of
+            BaseArchive.repack
+        """
+        trace = list(self._access_trace or ())
+        self._access_trace = None
+        return trace
 
     def archive_memory_size(self) -> int:
         """Get the current in memory size of all the modifies entries that
         have not yet been saved. You can use this to decide when you would
-        like to save in relation to the capacities of your machine.
-        """
-        return sum(
-            [
-                len(entry.content)
-                for entry in self.modified_entries.values()
-                if entry.action is FileAction.ADD
-            ]
+        like to save in relation to the capacities of your machine. This is
+        kept up to date as files are modified so it is cheap to call often.
+        """
+        return self._pending_bytes
+
+    def file_hash(self, name: str, algorithm: str = "crc32") -> str:
+        """Get the hex digest of the contents of a file. Digests of files
+        stored in the archive are cached until the file is edited or removed,
+        pending modified entries are always hashed from their content.
+
+        Params
+        -------
+        name : str
+            Name of the file, usually something like data\\ini\\weapon.ini
+        algorithm : str
+            Either crc32 or the name of any algorithm supported by hashlib,
+            such as blake2b. Defaults to crc32
+
+        Returns
+        --------
+        str
+            The hex digest of the file
+
+        Raises
+        ------
+            KeyError
+                File not found
+        """
+        return self.file_hashes([name], algorithm)[name]
+
+    def file_hashes(
+        self, names: Iterable[str] = None, algorithm: str = "crc32", *, workers: int = None
+    ) -> Dict[str, str]:
+        """Get the hex digests of several files at once. Files missing from the
+        cache are read in the order they are stored on disk and hashed in parallel.
+
+        Params
+        -------
+        names : Optional[Iterable[str]]
+            The files to hash, defaults to every file in the archive
+        algorithm : str
+            Either crc32 or the name of any algorithm supported by hashlib,
+            such as blake2b. Defaults to crc32
+        workers : Optional[int]
+            Maximum number of threads used for hashing
+
+        Returns
+        --------
+        Dict[str, str]
+            Mapping of file name to hex digest
+
+        Raises
+        ------
+            KeyError
+                File not found
+        """
+        if names is None:
+            names = self.file_list()
+
+        hashes = {}
+        missing = []
+        hits = 0
+        for name in names:
+            if not self.file_exists(name):
+                raise KeyError(f"File '{name}' does not exist.")
+
+            entry = self._stored_entry(name)
+            if entry is None:
+                hashes[name] = hash_data(self._read_pending(name), algorithm)
+                continue
+
+            cached = self._hash_cache.get((entry.position, entry.size), {})
+            if algorithm in cached:
+                hashes[name] = cached[algorithm]
+                hits += 1
+            else:
+                missing.append(entry)
+
+        if self.observer is not None:
+            self.observer.cache_hits += hits
+            self.observer.cache_misses += len(missing)
+
+        if not missing:
+            return hashes
+
+        # sequential reads, parallel hashing. Both zlib and hashlib release the GIL
+        # on large buffers.
+        missing.sort(key=lambda entry: entry.position)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # renamed and copied files are read from the data of their source
+            digests = executor.map(
+                lambda entry: hash_data(
+                    b"".join(self._read_ranges([(entry.position, entry.size)])), algorithm
+                ),
+                missing,
+            )
+            for entry, digest in zip(missing, digests):
+                self._hash_cache.setdefault((entry.position, entry.size), {})[algorithm] = digest
+                hashes[entry.name] = digest
+
+        return hashes
+
+    def save_hashes(self, path: str = None):
+        """Save the cached digests to a JSON file so they can be reused
+        the next time the archive is opened.
+
+        Params
+        -------
+        path : Optional[str]
+            Where to save the digests. Archives backed by a file default to
+            saving them next to it.
+        """
+        path = path or self._default_hash_path()
+        if path is None:
+            raise ValueError("Please specify a file path")
+
+        data = {
+            "stamp": self._hash_stamp(),
+            "entries": {
+                name: [entry.position, entry.size, self._hash_cache[(entry.position, entry.size)]]
+                for name, entry in self.entries.items()
+                if (entry.position, entry.size) in self._hash_cache
+            },
+        }
+
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+    def load_hashes(self, path: str = None) -> int:
+        """Load digests previously saved with BaseArchive.save_hashes. Digests
+        that no longer match the position and size of an entry are discarded, as
+        are all of them when the archive changed since they were saved.
+
+        Params
+        -------
+        path : Optional[str]
+            Where to load the digests from. Archives backed by a file default to
+            loading them from next to it.
+
+        Returns
+        --------
+        int
+            The number of entries for which digests were loaded
+        """
+        path = path or self._default_hash_path()
+        if path is None:
+            raise ValueError("Please specify a file path")
+
+        with open(path) as f:
+            data = json.load(f)
+
+        stamp = self._hash_stamp()
+        if stamp is None:
+            logging.info("archive cannot tell if it changed, ignoring saved hashes")
+            return 0
+
+        if data.get("stamp") != stamp:
+            logging.info("archive changed since hashes were saved, ignoring them")
+            return 0
+
+        loaded = 0
+        for name, (position, size, digests) in data["entries"].items():
+            entry = self.entries.get(name)
+            if entry is None or (entry.position, entry.size) != (position, size):
+                continue
+
+            self._hash_cache.setdefault((position, size), {}).update(digests)
+            loaded += 1
+
+        return loaded
+
+    def diff(
+        self, other: "BaseArchive", *, algorithm: str = "crc32", workers: int = None
+    ) -> ArchiveDiff:
+        """Compare this archive against an older version of it. Files of different
+        sizes are changed, only files of the same size are hashed to compare them.
+
+        Params
+        -------
+        other : BaseArchive
+            The archive to compare against
+        algorithm : str
+            The algorithm used to compare files of the same size, see
+            BaseArchive.file_hash. Defaults to crc32
+        workers : Optional[int]
+            Maximum number of threads used for hashing
+
+        Returns
+        --------
+        ArchiveDiff
+            The sorted names of the files only present in this archive (added),
+            only present in the other archive (removed) and present in both but with
+            different contents (changed).
+        """
+        names = set(self.file_list())
+        other_names = set(other.file_list())
+
+        changed = []
+        candidates = []
+        for name in sorted(names & other_names):
+            if self.get_file_entry(name).size != other.get_file_entry(name).size:
+                changed.append(name)
+            else:
+                candidates.append(name)
+
+        hashes = self.file_hashes(candidates, algorithm, workers=workers)
+        other_hashes = other.file_hashes(candidates, algorithm, workers=workers)
+        changed.extend(name for name in candidates if hashes[name] != other_hashes[name])
+        changed.sort()
+
+        return ArchiveDiff(sorted(names - other_names), sorted(other_names - names), changed)
+
+    def export_delta(
+        self, other: "BaseArchive", path: str, *, algorithm: str = "crc32", workers: int = None
+    ) -> ArchiveDiff:
+        """Write a new archive containing only the files added or changed since
+        the other archive. Removed files cannot be represented in an archive,
+        use the returned diff to handle them.
+
+        Params
+        -------
+        other : BaseArchive
+            The archive to compare against
+        path : str
+            The path to save the delta to. Something like 'path/to/file/delta.big'
+        algorithm : str
+            The algorithm used to compare files of the same size, see
+            BaseArchive.file_hash. Defaults to crc32
+        workers : Optional[int]
+            Maximum number of threads used for hashing
+
+        Returns
+        --------
+        ArchiveDiff
+            The differences between the two archives
+        """
+        diff = self.diff(other, algorithm=algorithm, workers=workers)
+        self._write_archive(path, [*diff.added, *diff.changed])
+        return diff
+
+    def save_volumes(self, path: str, *, max_size: int = MAX_VOLUME_SIZE) -> List[str]:
+        """Save the archive, including its pending modifications, split across as few
+        numbered archives as possible that are each at most max_size bytes. The files
+        of a directory are kept in the same archive when they fit. The archive itself
+        is not modified, use open_volume_set to read the volumes back as one.
+
+        Params
+        -------
+        path : str
+            The path of the volumes, the number of each volume is appended to the
+            file name so test.big gives test_001.big, test_002.big and so on
+        max_size : int
+            Maximum size of each volume. Defaults to the maximum supported by the
+            BIG format, 4GiB
+
+        Returns
+        --------
+        List[str]
+            The paths of the volumes
+
+        Raises
+        ------
+            MaxSizeError
+                A file does not fit in a volume
+        """
+        from .volumes import plan_volumes, volume_path
+
+        file_list = [(name, self.get_file_entry(name).size) for name in self.file_list()]
+        paths = []
+        for number, names in enumerate(plan_volumes(file_list, max_size), 1):
+            paths.append(volume_path(path, number))
+            self._write_archive(paths[-1], names)
+
+        return paths
+
+    def _write_archive(self, path: str, names: List[str]):
+        """Write a new archive made of a selection of files, copying their data
+        straight from this archive in the order it is stored.
+        """
+        sizes = {name: self.get_file_entry(name).size for name in names}
+        file_list = sorted(sizes.items())
+        layout = self._storage_order(names)
+
+        with open(path, "wb") as f:
+            self._pack_file_list(
+                f,
+                file_list,
+                sum(sizes.values()),
+                len(file_list),
+                self.header,
+                [(name, sizes[name]) for name in layout],
+            )
+            self._copy_files(layout, f)
+
+    def verify(self, *, refpack: bool = False, workers: int = None) -> VerifyReport:
+        """Check the integrity of the data stored in the archive, pending modified
+        entries are not checked. The header and the index are checked against the
+        size of the data. With refpack, files with a refpack header are also
+        decompressed in parallel to check that they decompress to their stated size.
+
+        Params
+        -------
+        refpack : bool
+            Also check the files with a refpack header. Defaults to False
+        workers : Optional[int]
+            Maximum number of processes used for decompressing
+
+        Returns
+        --------
+        VerifyReport
+            header_error is a description of what is wrong with the header or
+            the index, None if they are fine. size_mismatch is the size in the header
+            and the actual size of the data if they differ, else None. out_of_bounds is
+            the names of the files whose data is outside of the archive, overlapping
+            the pairs of names of files whose data overlaps, duplicates the names that
+            appear more than once in the index and corrupt a mapping of the names of
+            the files that could not be decompressed to the error.
+        """
+        data_size = self._data_size()
+        if data_size < 16:
+            return VerifyReport("Archive is truncated", None, [], [], [], {})
+
+        header = b"".join(self._read_ranges([(0, 16)]))
+        size = struct.unpack("<I", header[4:8])[0]
+        file_count, index_size = struct.unpack(">II", header[8:])
+        size_mismatch = (size, data_size) if size != data_size else None
+
+        header_error = None
+        if header[:4] not in (b"BIG4", b"BIGF"):
+            header_error = f"Unknown header {header[:4]!r}"
+
+        index_range = (16, max(min(index_size, data_size) - 16, 0))
+        index_data = b"".join(self._read_ranges([index_range]))
+        entries = []
+        offset = 0
+        entry_struct = struct.Struct(">II")
+        for _ in range(file_count):
+            end = index_data.find(b"\x00", offset + entry_struct.size)
+            if end < 0:
+                header_error = f"Index is truncated after {len(entries)} of {file_count} entries"
+                break
+
+            position, entry_size = entry_struct.unpack_from(index_data, offset)
+            name = index_data[offset + entry_struct.size : end].decode("latin-1")
+            entries.append(Entry(name, position, entry_size))
+            offset = end + 1
+
+        index_end = 16 + offset
+        out_of_bounds = sorted(
+            {
+                entry.name
+                for entry in entries
+                if entry.position + entry.size > data_size
+                or (entry.size and entry.position < index_end)
+            }
         )
 
+        overlapping = []
+        last = None
+        for entry in sorted(entries, key=lambda entry: (entry.position, entry.size)):
+            if not entry.size:
+                continue
+
+            if last is not None and entry.position < last.position + last.size:
+                overlapping.append((last.name, entry.name))
+
+            if last is None or entry.position + entry.size > last.position + last.size:
+                last = entry
+
+        seen = set()
+        duplicates = set()
+        for entry in entries:
+            if entry.name in seen:
+                duplicates.add(entry.name)
+            seen.add(entry.name)
+
+        corrupt = {}
+        if refpack:
+            # read straight from the index on disk, pending modifications do not apply
+            skipped = set(out_of_bounds)
+            stored = [entry for entry in entries if entry.name not in skipped]
+            corrupt = self._check_refpack(stored, workers)
+
+        return VerifyReport(
+            header_error, size_mismatch, out_of_bounds, overlapping, sorted(duplicates), corrupt
+        )
+
+    def _check_refpack(self, entries: List[Entry], workers: Optional[int]) -> Dict[str, str]:
+        """Decompress the files with a refpack header in parallel, reading them
+        in the order they are stored and only keeping a few of them in memory.
+        """
+        corrupt = {}
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            limit = workers * 4
+            pending = deque()
+            for name, data in self._iter_entries(entries):
+                if not has_refpack_header(data):
+                    continue
+
+                pending.append((name, executor.submit(_check_refpack, data)))
+                while len(pending) > limit or (pending and pending[0][1].done()):
+                    name, future = pending.popleft()
+                    error = future.result()
+                    if error is not None:
+                        corrupt[name] = error
+
+            for name, future in pending:
+                error = future.result()
+                if error is not None:
+                    corrupt[name] = error
+
+        return dict(sorted(corrupt.items()))
+
+    def search(
+        self, pattern, *, names: str = None, workers: int = None
+    ) -> Iterator[Tuple[str, int]]:
+        """Search the contents of the files for a regular expression. Files are read
+        in the order they are stored and searched in parallel, files with a refpack
+        header are decompressed first. Matches are yielded as they are found, file
+        by file in the order they are stored, pending modified entries first.
+
+        Params
+        -------
+        pattern : Union[bytes, str, re.Pattern]
+            The regular expression to search for, str patterns are encoded as latin-1
+        names : Optional[str]
+            Only search the files whose name matches this glob, such as
+            data\\ini\\*.ini. Defaults to every file
+        workers : Optional[int]
+            Maximum number of processes used for searching
+
+        Returns
+        --------
+        Iterator[Tuple[str, int]]
+            The name of the file and the offset of every match, within the
+            decompressed data for refpack files
+        """
+        if isinstance(pattern, str):
+            pattern = pattern.encode("latin-1")
+
+        pattern = re.compile(pattern)
+        file_list = self.file_list()
+        if names is not None:
+            regex = re.compile(fnmatch.translate(names))
+            file_list = [name for name in file_list if regex.match(name)]
+
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            limit = workers * 4
+            pending = deque()
+            batch = []
+            batch_size = 0
+            for name, data in self.iter_files(file_list):
+                batch.append((name, data))
+                batch_size += len(data)
+                if batch_size < SEARCH_BATCH_SIZE:
+                    continue
+
+                pending.append(executor.submit(_search_batch, pattern, batch))
+                batch = []
+                batch_size = 0
+                while len(pending) > limit or (pending and pending[0].done()):
+                    yield from pending.popleft().result()
+
+            if batch:
+                pending.append(executor.submit(_search_batch, pattern, batch))
+
+            for future in pending:
+                yield from future.result()
+
+    def analyze_compression(
+        self, *, samples: int = 4, workers: int = None
+    ) -> CompressionReport:
+        """Estimate how much space compressing the files of the archive with refpack
+        would save. Files with a refpack header are considered compressed, for the
+        others a few files of each extension are compressed in parallel, only their
+        first 64KiB, to estimate the compression ratio of the extension.
+
+        Params
+        -------
+        samples : int
+            Maximum number of files compressed for each extension. Defaults to 4
+        workers : Optional[int]
+            Maximum number of processes used for compressing
+
+        Returns
+        --------
+        CompressionReport
+            compressed is the names of the files with a refpack header and
+            compressed_size their total size. candidates is the files that would get
+            smaller, largest saving first, each with its size, the estimated bytes
+            saved and seconds needed to compress it. extensions maps every extension
+            of the uncompressed files to its number of files, their total size, the
+            estimated compressed size ratio and the seconds needed per MiB.
+        """
+        compressed = []
+        compressed_size = 0
+        uncompressed: Dict[str, List[Entry]] = {}
+        for name, header in self._read_prefixes(self.file_list(), 5):
+            entry = self.get_file_entry(name)
+            if has_refpack_header(header):
+                compressed.append(name)
+                compressed_size += entry.size
+            elif 0 < entry.size <= REFPACK_MAX_SIZE:
+                uncompressed.setdefault(_extension(name), []).append(entry)
+
+        sampled: Dict[str, str] = {}
+        for extension, entries in uncompressed.items():
+            step = max(len(entries) / samples, 1)
+            for x in range(min(samples, len(entries))):
+                sampled[entries[int(x * step)].name] = extension
+
+        totals = {extension: [0, 0, 0.0] for extension in uncompressed}
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            prefixes = list(self._read_prefixes(sampled, SAMPLE_SIZE))
+            results = executor.map(_sample_compression, [data for _, data in prefixes])
+            for (name, data), (size, seconds) in zip(prefixes, results):
+                total = totals[sampled[name]]
+                total[0] += len(data)
+                total[1] += size
+                total[2] += seconds
+
+        extensions = {}
+        candidates = []
+        for extension, entries in sorted(uncompressed.items()):
+            sample_size, sample_compressed, seconds = totals[extension]
+            estimate = CompressionEstimate(
+                len(entries),
+                sum(entry.size for entry in entries),
+                sample_compressed / sample_size,
+                seconds * 1024 * 1024 / sample_size,
+            )
+            extensions[extension] = estimate
+
+            for entry in entries:
+                saved = entry.size - int(entry.size * estimate.ratio)
+                if saved > 0:
+                    seconds = entry.size * estimate.seconds_per_mb / (1024 * 1024)
+                    candidates.append(CompressionCandidate(entry.name, entry.size, saved, seconds))
+
+        candidates.sort(key=lambda candidate: (-candidate.saved, candidate.name))
+        return CompressionReport(compressed, compressed_size, candidates, extensions)
+
+    def recompress(self, selection: Iterable, *, workers: int = None) -> Dict[str, int]:
+        """Compress files with refpack in parallel and repack the archive once with
+        all of them. Files that already have a refpack header, that are too large
+        for refpack or that would not get smaller are left as they are.
+
+        Params
+        -------
+        selection : Iterable[Union[str, CompressionCandidate]]
+            Names of the files to compress, or candidates from
+            BaseArchive.analyze_compression
+        workers : Optional[int]
+            Maximum number of processes used for compressing
+
+        Returns
+        --------
+        Dict[str, int]
+            The bytes saved for every file that was compressed
+
+        Raises
+        ------
+            KeyError
+                File not found
+        """
+        names = [getattr(item, "name", item) for item in selection]
+        names = [name for name in names if self.get_file_entry(name).size <= REFPACK_MAX_SIZE]
+
+        results = []
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            limit = workers * 4
+            pending = deque()
+            for name, data in self.iter_files(names):
+                if not data or has_refpack_header(data):
+                    continue
+
+                pending.append((name, len(data), executor.submit(compress, data)))
+                while len(pending) > limit or (pending and pending[0][2].done()):
+                    name, size, future = pending.popleft()
+                    results.append((name, size, future.result()))
+
+            results.extend((name, size, future.result()) for name, size, future in pending)
+
+        # the archive is only modified once every file is read
+        saved = {}
+        for name, size, data in results:
+            if len(data) < size:
+                self.edit_file(name, data)
+                saved[name] = size - len(data)
+
+        if saved:
+            self.repack()
+
+        return dict(sorted(saved.items()))
+
+    def _read_prefixes(self, names: Iterable[str], size: int) -> Iterator[Tuple[str, bytes]]:
+        """Read the start of files, pending files first then the stored ones in the
+        order they are stored, in a single pass over the archive
+        """
+        stored = []
+        for name in dict.fromkeys(names):
+            if not self.file_exists(name):
+                raise KeyError(f"File '{name}' does not exist.")
+
+            entry = self._stored_entry(name)
+            if entry is None:
+                yield name, self._read_pending(name)[:size]
+            else:
+                stored.append(entry)
+
+        stored.sort(key=lambda entry: entry.position)
+        ranges = [(entry.position, min(entry.size, size)) for entry in stored]
+        for entry, data in zip(stored, self._read_ranges(ranges)):
+            yield entry.name, bytes(data)
+
+    def _copy_files(self, names: List[str], out: IO):
+        """Write the data of files to a file one after the other, without
+        reading files stored in the archive whole if possible.
+        """
+        self._copy_entries((name, out) for name in names)
+
+    def _copy_entries(self, copies: Iterable[Tuple[str, IO]]):
+        """Write the data of every file to its destination, in order. Destinations
+        are only used until the next one is requested.
+        """
+        for name, out in copies:
+            entry = self._stored_entry(name)
+            if entry is None:
+                out.write(self._read_pending(name))
+            else:
+                for data in self._read_ranges([(entry.position, entry.size)]):
+                    out.write(data)
+
+    def _modify(self, edit: EntryEdit):
+        """Record a pending modification"""
+        previous = self.modified_entries.get(edit.name)
+        if previous is not None and previous.source is None:
+            self._pending_bytes -= previous.size
+
+        self.modified_entries[edit.name] = edit
+        if edit.source is None:
+            self._pending_bytes += edit.size
+
+    def _read_pending(self, name: str) -> bytes:
+        """Get the content of a pending modified entry"""
+        edit = self.modified_entries[name]
+        if edit.source is not None:
+            return self._get_file(edit.source)
+
+        return edit.content
+
+    def _stored_entry(self, name: str) -> Optional[Entry]:
+        """Get the entry of the data stored in the archive for a file, None if
+        the content of the file is pending.
+        """
+        edit = self.modified_entries.get(name)
+        if edit is None:
+            return self.entries[name]
+
+        if edit.source is not None:
+            return self.entries[edit.source]._replace(name=name)
+
+        return None
+
+    def _remap_hash_cache(self, old_entries: Dict[str, Entry]):
+        """Carry over the cached digests of unmodified files once the archive
+        has been repacked and their positions changed. Digests are keyed by the
+        stored data, which does not change until then, so they are only dropped
+        here and can be reused by files renamed or copied in the meantime.
+        """
+        cache = {}
+        for name, entry in self.entries.items():
+            edit = self.modified_entries.get(name)
+            old_entry = old_entries.get(name if edit is None else edit.source)
+            if old_entry is None:
+                continue
+
+            digests = self._hash_cache.get((old_entry.position, old_entry.size))
+            if digests is not None:
+                cache[(entry.position, entry.size)] = digests
+
+        self._hash_cache = cache
+
+    def _data_size(self) -> int:
+        """Archive specific size of the stored data"""
+        raise NotImplementedError
+
+    def _archive_mtime(self) -> Optional[int]:
+        """Archive specific modification time of the stored data, in nanoseconds"""
+        return None
+
+    def _default_hash_path(self) -> Optional[str]:
+        """Archive specific default location of the saved digests"""
+        return None
+
+    def _hash_stamp(self) -> Optional[list]:
+        """Archive specific value used to detect that the archive changed
+        since the digests were saved.
+        """
+        return None
+
     def _get_file(self, name: str) -> bytes:
         """Archive specific method for retrieving file bytes from
-        the archive.
+        the archive. Must be safe to call from several threads.
+        """
+
+        raise NotImplementedError
+
+    def _read_ranges(self, ranges: List[Tuple[int, int]]) -> Iterator[bytes]:
+        """Archive specific method for reading the (position, size) ranges of
+        the archive data, in the given order which is sorted by position.
         """
 
         raise NotImplementedError
 
-    def _pack(self):
+    def _pack(self, *, layout: Iterable[str] = None):
         """Rewrite the archive with the modifications stored
-        in self.modified_entries.
+        in self.modified_entries, with the data in the given layout.
         """
 
         raise NotImplementedError
@@ -398,13 +1724,15 @@ class BaseArchive:
 
         raise NotImplementedError
 
-    def save(self, path: str):
+    def save(self, path: str, *, layout: Iterable[str] = None):
         """Save the archive to a file.
 
         Params
         -------
         path : str
             The path to save to. Something like 'path/to/file/test.big'
+        layout : Optional[Iterable[str]]
+            Order in which to store the data of the files, see BaseArchive.repack
         """
         raise NotImplementedError
 
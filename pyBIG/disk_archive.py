@@ -2,12 +2,18 @@ import logging
 import os
 import shutil
 import tempfile
-from typing import IO, Type, TypeVar
+import threading
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type, TypeVar
 
-from .base_archive import BaseArchive, FileList
+from .base_archive import BaseArchive, EntryEdit, FileAction, FileList
+from .entry_table import EntryTable
+from .fastcopy import copy_range
+from .observer import ArchiveObserver, observe_phase
 
 T = TypeVar("T", bound="InDiskArchive")
 
+CHUNK_SIZE = 1024 * 1024
+
 
 class InDiskArchive(BaseArchive):
     """This implementation stores as few things possible in memory, preferring
@@ -15,44 +21,127 @@ class InDiskArchive(BaseArchive):
     archives into memory with minimal impact on memory usage. Assume all changes made
     are directly applied to the data in the disk.
 
+    Added and edited files are kept in memory until the archive is saved. With a
+    spool_threshold, once their size goes over the threshold they are moved to a
+    temporary spool file instead and only their position in it is kept. Spooled
+    entries have no content in modified_entries, use read_file to get it. The
+    spool file is closed by saving or closing the archive, or when leaving a with
+    block.
+
+    With auto_commit_bytes, the archive is saved as soon as the size of the pending
+    files, spooled or not, goes over the budget.
+
+    Pickling the archive only sends its path and its index, the file is not
+    opened or parsed again when unpickling. The observer and on_auto_commit are
+    not sent, unpickled copies have neither.
+
     Params
     -------
     file_path : str
         The path to the archive.
+    observer : Optional[ArchiveObserver]
+        Receives progress and timing events, see ArchiveObserver
+    spool_threshold : Optional[int]
+        Number of bytes of pending files kept in memory before they are
+        moved to the spool file. Defaults to keeping everything in memory
+    auto_commit_bytes : Optional[int]
+        Number of bytes of pending files after which the archive is saved.
+        Defaults to only saving when asked to
+    on_auto_commit : Optional[Callable[[InDiskArchive, int], None]]
+        Called after every automatic save with the archive and the number of
+        bytes of pending files that were saved
     """
 
-    def __init__(self, file_path: str, *, entries=None, header: str = "BIG4"):
+    def __init__(
+        self,
+        file_path: str,
+        *,
+        entries=None,
+        header: str = "BIG4",
+        observer: ArchiveObserver = None,
+        spool_threshold: int = None,
+        auto_commit_bytes: int = None,
+        on_auto_commit: Callable[["InDiskArchive", int], None] = None,
+    ):
         self.file_path = file_path
         self.modified_entries = {}
+        self.observer = observer
+        self.spool_threshold = spool_threshold
+        self.auto_commit_bytes = auto_commit_bytes
+        self.on_auto_commit = on_auto_commit
+        self._hash_cache = {}
+        self._pending_bytes = 0
+
+        self._spool: Optional[IO] = None
+        self._spool_lock = threading.Lock()
+        # position in the spool of the spooled entries
+        self._spooled: Dict[str, int] = {}
+        self._spooled_bytes = 0
 
         if not os.path.exists(file_path):
             raise ValueError(f"File {file_path} not found")
 
         if entries is None:
             with open(self.file_path, "rb") as f:
-                self.entries, self.header = self._unpack(f)
+                self.entries, self.header = self._unpack(f, observer)
         else:
             self.entries = entries
             self.header = header
 
+    def __getstate__(self):
+        # pending spooled entries are sent along with their content
+        state = self.__dict__.copy()
+        state["modified_entries"] = {
+            name: edit._replace(content=self._read_pending(name)) if name in self._spooled else edit
+            for name, edit in self.modified_entries.items()
+        }
+        state.update(_spool=None, _spool_lock=None, _spooled={}, _spooled_bytes=0)
+        # callbacks are often lambdas and counters would diverge in every process
+        state.update(observer=None, on_auto_commit=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._spool_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
     def __repr__(self):
         return f"< LargeArchive path={self.file_path} entries={len(self.entries)} dirty={bool(self.modified_entries)} >"
 
-    def _pack(self, file_path=None):
+    def _pack(self, file_path=None, *, layout: Iterable[str] = None):
         """Rewrite the archive with the modifications stores
         in self.modified_entries."""
-        file_data = self._create_file_list()
+        file_list, total_size, file_count = self._create_file_list()
+        data_order = self._layout(file_list, layout)
 
         with tempfile.NamedTemporaryFile(delete=False) as fp:
-            entries = self._pack_file_list(fp, *file_data, self.header)
+            with observe_phase(self.observer, "index"):
+                entries = self._pack_file_list(
+                    fp, file_list, total_size, file_count, self.header, data_order
+                )
             name = fp.name
 
-            self._pack_files(fp, *file_data)
+            with observe_phase(self.observer, "data"):
+                self._pack_files(fp, data_order or file_list, total_size, file_count)
+
+            with observe_phase(self.observer, "fsync"):
+                fp.flush()
+                os.fsync(fp.fileno())
 
         path = file_path or self.file_path
+        old_entries = self.entries
         self.entries = entries
-        shutil.move(name, path)
+        with observe_phase(self.observer, "move"):
+            shutil.move(name, path)
+        self._remap_hash_cache(old_entries)
         self.modified_entries = {}
+        self._pending_bytes = 0
+        self._close_spool()
 
     def _pack_files(
         self, raw_data_file: IO, file_list: FileList, total_size: int, file_count: int
@@ -61,26 +150,162 @@ class InDiskArchive(BaseArchive):
         logging.info("packing files")
 
         # raw file data at the positions specified in the index
+        observer = self.observer
         with open(self.file_path, "rb") as existing_archive:
             for file in file_list:
-                if file[0] in self.modified_entries:
-                    file_entry = self.modified_entries[file[0]]
-                    raw_data_file.write(file_entry.content)
+                file_entry = self._stored_entry(file[0])
+                if file[0] in self._spooled:
+                    self._copy_spooled(file[0], raw_data_file)
+                elif file_entry is None:
+                    raw_data_file.write(self.modified_entries[file[0]].content)
                 else:
-                    file_entry = self.entries[file[0]]
                     existing_archive.seek(file_entry.position)
                     raw_data_file.write(existing_archive.read(file_entry.size))
 
+                    if observer is not None:
+                        observer.read(file_entry.size, seek=True)
+
+                if observer is not None:
+                    observer.entry("data", file[0], file[1])
+
         logging.info("finished packing files")
 
+    def _copy_entries(self, copies: Iterable[Tuple[str, IO]]):
+        observer = self.observer
+        with open(self.file_path, "rb") as f:
+            for name, out in copies:
+                entry = self._stored_entry(name)
+                if name in self._spooled:
+                    self._copy_spooled(name, out)
+                elif entry is None:
+                    out.write(self.modified_entries[name].content)
+                else:
+                    copy_range(f, out, entry.position, entry.size)
+                    if observer is not None:
+                        observer.read(entry.size, seek=True)
+
     def _get_file(self, name: str) -> bytes:
         """Get the contents of a specific file in the big based on file name"""
         entry = self.entries[name]
+        if self.observer is not None:
+            self.observer.read(entry.size, seek=True)
+
         with open(self.file_path, "rb") as f:
             f.seek(entry.position)
             return f.read(entry.size)
 
-    def save(self, path: str = None):
+    def archive_memory_size(self) -> int:
+        """Get the current in memory size of all the modifies entries that
+        have not yet been saved, spooled entries are not counted.
+        """
+        return self._pending_bytes - self._spooled_bytes
+
+    def _modify(self, edit: EntryEdit):
+        if self._spooled.pop(edit.name, None) is not None:
+            self._spooled_bytes -= self.modified_entries[edit.name].size
+
+        super()._modify(edit)
+
+        if self.auto_commit_bytes is not None and self._pending_bytes > self.auto_commit_bytes:
+            committed = self._pending_bytes
+            logging.info(f"auto committing {committed} bytes")
+            self._pack()
+            if self.on_auto_commit is not None:
+                self.on_auto_commit(self, committed)
+        elif self.spool_threshold is not None and self.archive_memory_size() > self.spool_threshold:
+            self._spill()
+
+    def _spill(self):
+        """Move the content of the pending entries kept in memory to the spool"""
+        if self._spool is None:
+            self._spool = tempfile.TemporaryFile()
+
+        with self._spool_lock:
+            self._spool.seek(0, os.SEEK_END)
+            for name, edit in self.modified_entries.items():
+                if edit.content is None:
+                    continue
+
+                self._spooled[name] = self._spool.tell()
+                self._spool.write(edit.content)
+                self.modified_entries[name] = EntryEdit(name, FileAction.ADD, None, edit.size)
+
+        logging.info(f"spooled {self.archive_memory_size()} bytes")
+        self._spooled_bytes = self._pending_bytes
+
+    def _read_pending(self, name: str) -> bytes:
+        if name not in self._spooled:
+            return super()._read_pending(name)
+
+        with self._spool_lock:
+            self._spool.seek(self._spooled[name])
+            return self._spool.read(self.modified_entries[name].size)
+
+    def _copy_spooled(self, name: str, raw_data_file: IO):
+        with self._spool_lock:
+            self._spool.seek(self._spooled[name])
+            remaining = self.modified_entries[name].size
+            while remaining > 0:
+                chunk = self._spool.read(min(remaining, CHUNK_SIZE))
+                raw_data_file.write(chunk)
+                remaining -= len(chunk)
+
+    def close(self):
+        """Close the spool file, the content of the pending spooled files is lost.
+        The archive can still be used afterwards, but should be saved first if it
+        has pending files. This is also done when leaving a with block.
+        """
+        if self._spooled:
+            logging.info(f"discarding {len(self._spooled)} spooled files")
+            for name in self._spooled:
+                edit = self.modified_entries.pop(name)
+                self._pending_bytes -= edit.size
+
+        self._close_spool()
+
+    def _close_spool(self):
+        if self._spool is not None:
+            self._spool.close()
+
+        self._spool = None
+        self._spooled = {}
+        self._spooled_bytes = 0
+
+    def _read_ranges(self, ranges: List[Tuple[int, int]]) -> Iterator[bytes]:
+        observer = self.observer
+        with open(self.file_path, "rb") as f:
+            if ranges and hasattr(os, "posix_fadvise"):
+                start = ranges[0][0]
+                end = max(position + size for position, size in ranges)
+                try:
+                    os.posix_fadvise(f.fileno(), start, end - start, os.POSIX_FADV_SEQUENTIAL)
+                except OSError:
+                    pass
+
+            for position, size in ranges:
+                seek = f.tell() != position
+                if seek:
+                    f.seek(position)
+
+                if observer is not None:
+                    observer.read(size, seek=seek)
+
+                yield f.read(size)
+
+    def _data_size(self) -> int:
+        return os.path.getsize(self.file_path)
+
+    def _archive_mtime(self) -> int:
+        return os.stat(self.file_path).st_mtime_ns
+
+    def _default_hash_path(self) -> str:
+        return f"{self.file_path}.hashes.json"
+
+    def _hash_stamp(self) -> list:
+        stat = os.stat(self.file_path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def save(self, path: str = None, *, layout: Iterable[str] = None):
         """Save the archive to a file.
 
         Params
@@ -88,12 +313,22 @@ class InDiskArchive(BaseArchive):
         path : Optional[str]
             The new path to save to. Something like 'path/to/file/test.big'.
             Omit this if you just want to save in the same file.
+        layout : Optional[Iterable[str]]
+            Order in which to store the data of the files, see BaseArchive.repack
         """
-        self._pack(path)
+        self._pack(path, layout=layout)
 
     @classmethod
     def from_directory(
-        cls: Type[T], path: str, header: str = "BIG4", *, file_path: str = None
+        cls: Type[T],
+        path: str,
+        header: str = "BIG4",
+        *,
+        file_path: str = None,
+        observer: ArchiveObserver = None,
+        spool_threshold: int = None,
+        auto_commit_bytes: int = None,
+        on_auto_commit: Callable[["InDiskArchive", int], None] = None,
     ) -> T:
         """Generate a BIG archive from a directory. This is useful for
         compiling an archive without adding each file manually. You simply
@@ -107,6 +342,16 @@ class InDiskArchive(BaseArchive):
             The type of the archive, either BIG4 or BIGF
         file_path : str
             Path to save the new archive
+        observer : Optional[ArchiveObserver]
+            Receives progress and timing events, see ArchiveObserver
+        spool_threshold : Optional[int]
+            Number of bytes of files kept in memory before they are moved
+            to a spool file while building the archive
+        auto_commit_bytes : Optional[int]
+            Number of bytes of files after which the archive is saved while
+            building it, see InDiskArchive
+        on_auto_commit : Optional[Callable[[InDiskArchive, int], None]]
+            Called after every automatic save, see InDiskArchive
 
         Returns
         --------
@@ -116,10 +361,27 @@ class InDiskArchive(BaseArchive):
         if file_path is None:
             raise ValueError("Please specify a file path")
 
-        return cls._pack_archive_from_directory(cls.empty(header, file_path=file_path), path)
+        archive = cls.empty(
+            header,
+            file_path=file_path,
+            observer=observer,
+            spool_threshold=spool_threshold,
+            auto_commit_bytes=auto_commit_bytes,
+            on_auto_commit=on_auto_commit,
+        )
+        return cls._pack_archive_from_directory(archive, path)
 
     @classmethod
-    def empty(cls: Type[T], header: str = "BIG4", *, file_path: str = None) -> T:
+    def empty(
+        cls: Type[T],
+        header: str = "BIG4",
+        *,
+        file_path: str = None,
+        observer: ArchiveObserver = None,
+        spool_threshold: int = None,
+        auto_commit_bytes: int = None,
+        on_auto_commit: Callable[["InDiskArchive", int], None] = None,
+    ) -> T:
         """Generate an empty archive.
 
         Params
@@ -128,6 +390,16 @@ class InDiskArchive(BaseArchive):
             The type of the archive, can either be BIG4 or BIGF. Defaults to BIG4
         file_path : str
             Path to save the new archive
+        observer : Optional[ArchiveObserver]
+            Receives progress and timing events, see ArchiveObserver
+        spool_threshold : Optional[int]
+            Number of bytes of pending files kept in memory before they are
+            moved to a spool file, see InDiskArchive
+        auto_commit_bytes : Optional[int]
+            Number of bytes of pending files after which the archive is saved,
+            see InDiskArchive
+        on_auto_commit : Optional[Callable[[InDiskArchive, int], None]]
+            Called after every automatic save, see InDiskArchive
 
         Returns
         --------
@@ -137,7 +409,15 @@ class InDiskArchive(BaseArchive):
         with open(file_path, "wb") as f:
             f.write(b"")
 
-        return cls(file_path, entries={}, header=header)
+        return cls(
+            file_path,
+            entries=EntryTable(),
+            header=header,
+            observer=observer,
+            spool_threshold=spool_threshold,
+            auto_commit_bytes=auto_commit_bytes,
+            on_auto_commit=on_auto_commit,
+        )
 
     def bytes(self) -> bytes:
         """Returns the archive data as bytes
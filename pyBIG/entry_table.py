@@ -0,0 +1,162 @@
+import zlib
+from array import array
+from collections import namedtuple
+from typing import ItemsView, Iterable, Iterator, Mapping, Tuple, ValuesView
+
+Entry = namedtuple("Entry", "name position size")
+
+
+class EntryTable(Mapping[str, Entry]):
+    """Compact read-only mapping of file names to their Entry, used as the
+    index of archives.
+
+    Positions and sizes are stored in array columns, names in a single latin-1
+    encoded blob with a table of offsets and lookups go through an open addressing
+    hash table of row numbers. This costs around 20 bytes plus the length of the
+    name per entry, against a few hundred bytes for a dict of Entry.
+
+    Entry objects are created on access. When a name appears more than once
+    the last occurence wins, like it would in a dict.
+
+    Params
+    -------
+    entries : Iterable[Tuple[str, int, int]]
+        The name, position and size of every entry
+    """
+
+    __slots__ = ("_positions", "_sizes", "_offsets", "_names", "_table", "_mask")
+
+    def __init__(self, entries: Iterable[Tuple[str, int, int]] = ()):
+        self._positions = array("I")
+        self._sizes = array("I")
+        self._offsets = array("I", [0])
+        self._names = bytearray()
+        self._table = array("i", [0] * 8)
+        self._mask = 7
+
+        for name, position, size in entries:
+            self._insert(name.encode("latin-1"), position, size)
+
+    def __reduce__(self):
+        return (
+            _rebuild_table,
+            (self._positions, self._sizes, self._offsets, self._names, self._table, self._mask),
+        )
+
+    def __repr__(self):
+        return f"< EntryTable entries={len(self)} >"
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __iter__(self) -> Iterator[str]:
+        names = self._names
+        offsets = self._offsets
+        for row in range(len(self._positions)):
+            yield names[offsets[row] : offsets[row + 1]].decode("latin-1")
+
+    def __contains__(self, name: object) -> bool:
+        return self._row(name) >= 0
+
+    def __getitem__(self, name: str) -> Entry:
+        row = self._row(name)
+        if row < 0:
+            raise KeyError(name)
+
+        return Entry(name, self._positions[row], self._sizes[row])
+
+    def values(self) -> ValuesView[Entry]:
+        return _EntryValues(self)
+
+    def items(self) -> ItemsView[str, Entry]:
+        return _EntryItems(self)
+
+    def _entries(self) -> Iterator[Entry]:
+        """Walk the columns instead of looking up every name"""
+        positions = self._positions
+        sizes = self._sizes
+        for row, name in enumerate(self):
+            yield Entry(name, positions[row], sizes[row])
+
+    def _row(self, name: object) -> int:
+        if not isinstance(name, str):
+            return -1
+
+        try:
+            encoded = name.encode("latin-1")
+        except UnicodeEncodeError:
+            return -1
+
+        return self._find(encoded, zlib.crc32(encoded))[0]
+
+    def _find(self, encoded: bytes, key: int) -> Tuple[int, int]:
+        """Get the row of an encoded name, or -1 if it is not in the table,
+        along with the slot of the hash table it is or would be in.
+        """
+        table = self._table
+        mask = self._mask
+        names = self._names
+        offsets = self._offsets
+
+        slot = key & mask
+        while True:
+            row = table[slot] - 1
+            if row < 0 or names[offsets[row] : offsets[row + 1]] == encoded:
+                return row, slot
+
+            slot = (slot + 1) & mask
+
+    def _insert(self, encoded: bytes, position: int, size: int):
+        row, slot = self._find(encoded, zlib.crc32(encoded))
+        if row >= 0:
+            self._positions[row] = position
+            self._sizes[row] = size
+            return
+
+        self._positions.append(position)
+        self._sizes.append(size)
+        self._names += encoded
+        self._offsets.append(len(self._names))
+        self._table[slot] = len(self._positions)
+
+        # keep the load factor under 1/2 so probing stays short
+        if len(self._positions) * 2 > self._mask:
+            self._grow()
+
+    def _grow(self):
+        size = (self._mask + 1) * 4
+        table = array("i", [0]) * size
+        mask = size - 1
+        names = self._names
+        offsets = self._offsets
+
+        for row in range(len(self._positions)):
+            slot = zlib.crc32(names[offsets[row] : offsets[row + 1]]) & mask
+            while table[slot]:
+                slot = (slot + 1) & mask
+            table[slot] = row + 1
+
+        self._table = table
+        self._mask = mask
+
+
+class _EntryValues(ValuesView[Entry]):
+    def __iter__(self) -> Iterator[Entry]:
+        return self._mapping._entries()
+
+
+class _EntryItems(ItemsView[str, Entry]):
+    def __iter__(self) -> Iterator[Tuple[str, Entry]]:
+        for entry in self._mapping._entries():
+            yield entry.name, entry
+
+
+def _rebuild_table(positions, sizes, offsets, names, table, mask) -> EntryTable:
+    entries = EntryTable.__new__(EntryTable)
+    entries._positions = positions
+    entries._sizes = sizes
+    entries._offsets = offsets
+    entries._names = names
+    entries._table = table
+    entries._mask = mask
+    return entries
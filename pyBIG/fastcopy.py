@@ -0,0 +1,87 @@
+"""Copies between files that stay in the kernel where the platform allows it,
+falling back to reading and writing fixed size chunks.
+"""
+
+import io
+import os
+import sys
+from typing import IO
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _kernel_copy(source: IO, destination: IO, position: int, size: int) -> int:
+    """Copy as much as possible without going through user space, returns the
+    number of bytes copied.
+    """
+    try:
+        source_fd = source.fileno()
+        destination_fd = destination.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        return 0
+
+    # data buffered by python has to land before the kernel writes after it
+    destination.flush()
+
+    copied = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < size:
+                count = os.copy_file_range(
+                    source_fd, destination_fd, size - copied, position + copied
+                )
+                if count == 0:
+                    break
+                copied += count
+        except OSError:
+            pass
+
+    # sendfile only accepts a regular file as destination on linux
+    if copied < size and hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+        try:
+            while copied < size:
+                count = os.sendfile(destination_fd, source_fd, position + copied, size - copied)
+                if count == 0:
+                    break
+                copied += count
+        except OSError:
+            pass
+
+    if copied and destination.seekable():
+        # keep the buffered object in line with the position of the descriptor
+        destination.seek(os.lseek(destination_fd, 0, os.SEEK_CUR))
+
+    return copied
+
+
+def copy_range(source: IO, destination: IO, position: int, size: int):
+    """Copy size bytes of source, starting at position, to the current position of
+    destination. Uses copy_file_range or sendfile when both are real files and
+    chunks of at most CHUNK_SIZE bytes otherwise, memory usage is constant either way.
+
+    Params
+    -------
+    source : IO
+        File opened for binary reading, its position is not preserved
+    destination : IO
+        File opened for binary writing
+    position : int
+        Position of the first byte to copy in source
+    size : int
+        Number of bytes to copy
+
+    Raises
+    ------
+        ValueError
+            The source ends before the end of the range
+    """
+    copied = _kernel_copy(source, destination, position, size)
+
+    source.seek(position + copied)
+    while copied < size:
+        chunk = source.read(min(CHUNK_SIZE, size - copied))
+        if not chunk:
+            raise ValueError(f"Source ended {size - copied} bytes before the end of the range")
+
+        destination.write(chunk)
+        copied += len(chunk)
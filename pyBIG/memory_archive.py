@@ -1,12 +1,58 @@
 import io
 import logging
-from typing import IO, Type, TypeVar
+import weakref
+import zlib
+from multiprocessing.shared_memory import SharedMemory
+from typing import IO, Iterable, Iterator, List, Tuple, Type, TypeVar
 
 from .base_archive import BaseArchive, FileList
+from .entry_table import EntryTable
+from .observer import ArchiveObserver, observe_phase
 
 T = TypeVar("T", bound="InMemoryArchive")
 
 
+# handles whose data was still in use when they were released
+_unclosed: List[SharedMemory] = []
+
+
+def _close_shared_memory(memory: SharedMemory, owner: bool):
+    """Free the block if this handle created it and close the handle. Handles
+    cannot be closed while views of their data are alive, such as the files of
+    an iter_files in progress, they are kept and closed on a later release.
+    """
+    if owner:
+        memory.unlink()
+
+    _unclosed.append(memory)
+    for handle in list(_unclosed):
+        try:
+            handle.close()
+        except BufferError:
+            continue
+
+        _unclosed.remove(handle)
+
+
+class _SharedBuffer:
+    """Stands in for the BytesIO of an archive whose data is in shared memory.
+    The block is freed when the buffer that created it is released or garbage
+    collected.
+    """
+
+    def __init__(self, memory: SharedMemory, size: int, owner: bool):
+        self.memory = memory
+        self.size = size
+        self.owner = owner
+        self._finalizer = weakref.finalize(self, _close_shared_memory, memory, owner)
+
+    def getvalue(self) -> memoryview:
+        return self.memory.buf[: self.size]
+
+    def release(self):
+        self._finalizer()
+
+
 class InMemoryArchive(BaseArchive):
     """The core of the library, represents a BIG file and allows
     the user to mainpulate it programatically.
@@ -15,10 +61,17 @@ class InMemoryArchive(BaseArchive):
     creating unecessary clutter that needs to be cleaned up. All
     disk action need to be explicit through .save
 
+    Archives can be pickled, to send them to other processes for example. The data
+    is copied along unless it was first moved to shared memory with
+    InMemoryArchive.share_memory, in which case only its name is sent. The
+    observer is not sent.
+
     Params
     -------
     content : Optional[bytes]
         Raw bytes of the original big file
+    observer : Optional[ArchiveObserver]
+        Receives progress and timing events, see ArchiveObserver
 
     """
 
@@ -27,27 +80,118 @@ class InMemoryArchive(BaseArchive):
         self.entries = kwargs.get("entries")
         self.modified_entries = {}
         self.header = kwargs.get("header", "BIG4")
+        self.observer = kwargs.get("observer")
+        self._hash_cache = {}
+        self._pending_bytes = 0
 
         if self.entries is None:
-            self.entries, self.header = self._unpack(self.archive)
+            self.entries, self.header = self._unpack(self.archive, self.observer)
 
     def __repr__(self):
         return f"< Archive entries={len(self.entries)} dirty={bool(self.modified_entries)} >"
 
-    def _pack(self):
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["observer"] = None
+        if isinstance(self.archive, _SharedBuffer):
+            state["archive"] = (self.archive.memory.name, self.archive.size)
+
+        return state
+
+    def __setstate__(self, state):
+        if isinstance(state["archive"], tuple):
+            name, size = state["archive"]
+            state["archive"] = _SharedBuffer(SharedMemory(name), size, owner=False)
+
+        self.__dict__.update(state)
+
+    @property
+    def shared_memory(self) -> bool:
+        """Whether the data of the archive is in shared memory"""
+        return isinstance(self.archive, _SharedBuffer)
+
+    def share_memory(self):
+        """Move the data of the archive to shared memory, so that pickling the
+        archive only sends the name of the shared memory block instead of the data.
+        Unpickled copies attach to the same block without copying it.
+
+        The block is freed when the archive that created it is repacked or when
+        InMemoryArchive.release_memory is called. Copies keep working as long as
+        they are attached.
+        """
+        if self.shared_memory:
+            return
+
+        data = self.archive.getvalue()
+        memory = SharedMemory(create=True, size=max(len(data), 1))
+        memory.buf[: len(data)] = data
+        self.archive = _SharedBuffer(memory, len(data), owner=True)
+
+    def release_memory(self):
+        """Move the data of the archive back from shared memory to a private buffer
+        and detach from the shared memory block, freeing it if this archive created it.
+        Data read from the archive before, such as the files of an iter_files still
+        in progress, stays readable, the block is only unmapped once it is dropped.
+        """
+        if not self.shared_memory:
+            return
+
+        shared = self.archive
+        self.archive = io.BytesIO(shared.getvalue())
+        shared.release()
+
+    def snapshot(self: T) -> T:
+        """Create an independent copy of the archive. The copy shares the data and
+        the index of this archive instead of copying them, only the pending
+        modified entries are copied. Repacking either archive does not affect
+        the other. A snapshot of an archive in shared memory attaches to the same
+        block, see InMemoryArchive.share_memory.
+
+        Returns
+        --------
+        InMemoryArchive
+            The copy
+        """
+        if self.shared_memory:
+            # BytesIO would copy the shared block
+            snapshot = type(self)(entries=self.entries, header=self.header)
+            memory = SharedMemory(self.archive.memory.name)
+            snapshot.archive = _SharedBuffer(memory, self.archive.size, owner=False)
+        else:
+            snapshot = type(self)(self.archive.getvalue(), entries=self.entries, header=self.header)
+
+        snapshot.observer = self.observer
+        snapshot.modified_entries = dict(self.modified_entries)
+        snapshot._pending_bytes = self._pending_bytes
+        snapshot._hash_cache = dict(self._hash_cache)
+        return snapshot
+
+    def _pack(self, *, layout: Iterable[str] = None):
         """Rewrite the archive with the modifications stored
         in self.modified_entries."""
         new_archive = io.BytesIO()
 
-        file_data = self._create_file_list()
-        entries = self._pack_file_list(new_archive, *file_data, self.header)
+        file_list, total_size, file_count = self._create_file_list()
+        data_order = self._layout(file_list, layout)
+        with observe_phase(self.observer, "index"):
+            entries = self._pack_file_list(
+                new_archive, file_list, total_size, file_count, self.header, data_order
+            )
 
-        self._pack_files(new_archive, *file_data)
+        with observe_phase(self.observer, "data"):
+            self._pack_files(new_archive, data_order or file_list, total_size, file_count)
+        # trim the buffer to its actual size now rather than on the first read
+        new_archive.getvalue()
 
+        old_entries = self.entries
+        if self.shared_memory:
+            self.archive.release()
         self.archive = new_archive
         self.entries = entries
         self.archive.seek(0)
+        self._remap_hash_cache(old_entries)
         self.modified_entries = {}
+        self._pending_bytes = 0
 
     def _pack_files(
         self, raw_data_file: IO, file_list: FileList, total_size: int, file_count: int
@@ -55,34 +199,61 @@ class InMemoryArchive(BaseArchive):
         """Combine all files into a single raw data bundle"""
 
         logging.info("packing files")
+        observer = self.observer
         for file in file_list:
             if file[0] in self.modified_entries:
-                file_entry = self.modified_entries[file[0]]
-                raw_data_file.write(file_entry.content)
+                raw_data_file.write(self._read_pending(file[0]))
             else:
                 raw_data_file.write(self._get_file(file[0]))
+
+            if observer is not None:
+                observer.entry("data", file[0], file[1])
         logging.info("finished packing files")
 
     def _get_file(self, name: str) -> bytes:
         """Get the contents of a specific file in the big based on file name"""
         entry = self.entries[name]
-        self.archive.seek(entry.position)
-        return self.archive.read(entry.size)
+        if self.observer is not None:
+            self.observer.read(entry.size)
+
+        # getvalue does not copy the buffer and, unlike seek and read, is thread safe
+        return bytes(self.archive.getvalue()[entry.position : entry.position + entry.size])
+
+    def _read_ranges(self, ranges: List[Tuple[int, int]]) -> Iterator[bytes]:
+        data = memoryview(self.archive.getvalue())
+        for position, size in ranges:
+            if self.observer is not None:
+                self.observer.read(size)
 
-    def save(self, path: str):
+            yield data[position : position + size]
+
+    def _data_size(self) -> int:
+        return len(self.archive.getvalue())
+
+    def _hash_stamp(self) -> list:
+        # there is no modification time, archives with the same layout only
+        # differ by their content
+        data = self.archive.getvalue()
+        return [len(data), zlib.crc32(data) & 0xFFFFFFFF]
+
+    def save(self, path: str, *, layout: Iterable[str] = None):
         """Save the archive to a file.
 
         Params
         -------
         path : str
             The path to save to. Something like 'path/to/file/test.big'
+        layout : Optional[Iterable[str]]
+            Order in which to store the data of the files, see BaseArchive.repack
         """
-        self._pack()
+        self._pack(layout=layout)
         with open(path, "wb") as f:
             f.write(self.archive.getvalue())
 
     @classmethod
-    def from_directory(cls: Type[T], path: str, header: str = "BIG4") -> T:
+    def from_directory(
+        cls: Type[T], path: str, header: str = "BIG4", *, observer: ArchiveObserver = None
+    ) -> T:
         """Generate a BIG archive from a directory. This is useful for
         compiling an archive without adding each file manually. You simply
         give the top level directory and every file will be added recursively.
@@ -93,29 +264,33 @@ class InMemoryArchive(BaseArchive):
             Path to the top level folder of the files you wish to compile
         header : str
             The type of archive, either BIG4 or BIGF. Defaults to BIG4
+        observer : Optional[ArchiveObserver]
+            Receives progress and timing events, see ArchiveObserver
 
         Returns
         --------
         Archive
             Compiled archived
         """
-        return cls._pack_archive_from_directory(cls.empty(header), path)
+        return cls._pack_archive_from_directory(cls.empty(header, observer=observer), path)
 
     @classmethod
-    def empty(cls: Type[T], header: str = "BIG4") -> T:
+    def empty(cls: Type[T], header: str = "BIG4", *, observer: ArchiveObserver = None) -> T:
         """Generate an empty archive.
 
         Params
         -------
         header : str
             The type of the archive, can either be BIG4 or BIGF. Defaults to BIG4
+        observer : Optional[ArchiveObserver]
+            Receives progress and timing events, see ArchiveObserver
 
         Returns
         --------
         Archive
             Empty archive
         """
-        return cls(entries={}, header=header)
+        return cls(entries=EntryTable(), header=header, observer=observer)
 
     def bytes(self) -> bytes:
         """Returns the archive data as bytes
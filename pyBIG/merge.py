@@ -0,0 +1,100 @@
+import logging
+import os
+from typing import Dict, Iterable, List, Union
+
+from .base_archive import BaseArchive
+from .disk_archive import InDiskArchive
+
+CONFLICTS = ("last", "first", "error")
+
+
+def merge_archives(
+    sources: Iterable[Union[str, BaseArchive]],
+    dest: str,
+    *,
+    conflict: str = "last",
+    header: str = None,
+) -> InDiskArchive:
+    """Merge several archives into a new one. The new index is computed from the
+    indexes of the sources alone and the data of every file is copied straight
+    from its source into the new archive, with kernel copies when the source is
+    on disk. Files are never loaded whole in memory.
+
+    The data of each source is copied in the order it is stored, one source after
+    the other, so every source is read sequentially.
+
+    Params
+    -------
+    sources : Iterable[Union[str, BaseArchive]]
+        The archives to merge, either paths or archives. Pending modifications
+        of archives are included
+    dest : str
+        The path to save the new archive to, cannot be one of the sources
+    conflict : str
+        Which file to keep when several sources contain the same name, either
+        last, first or error to raise a KeyError. Defaults to last
+    header : Optional[str]
+        The type of the new archive, defaults to the type of the first source
+
+    Returns
+    --------
+    InDiskArchive
+        The new archive
+
+    Raises
+    ------
+        KeyError
+            The same file is in several sources and conflict is error
+        ValueError
+            Unknown conflict or the destination is one of the sources
+        MaxSizeError
+            The new archive would be bigger than supported by the BIG format
+    """
+    if conflict not in CONFLICTS:
+        raise ValueError(f"Unknown conflict '{conflict}', use one of {', '.join(CONFLICTS)}")
+
+    archives = [
+        InDiskArchive(source) if isinstance(source, str) else source for source in sources
+    ]
+    for archive in archives:
+        path = getattr(archive, "file_path", None)
+        if path is not None and os.path.abspath(path) == os.path.abspath(dest):
+            raise ValueError(f"Cannot merge {path} into itself")
+
+    chosen: Dict[str, BaseArchive] = {}
+    sizes: Dict[str, int] = {}
+    for archive in archives:
+        for name in archive.file_list():
+            if name in chosen:
+                if conflict == "error":
+                    raise KeyError(f"File '{name}' is in several archives.")
+                if conflict == "first":
+                    continue
+
+            chosen[name] = archive
+            sizes[name] = archive.get_file_entry(name).size
+
+    # an archive can be given more than once, its files are copied together
+    unique = list({id(archive): archive for archive in archives}.values())
+    layout: Dict[int, List[str]] = {id(archive): [] for archive in unique}
+    for name, archive in chosen.items():
+        layout[id(archive)].append(name)
+
+    # pending files have a position of -1 and come first
+    for archive in unique:
+        layout[id(archive)].sort(key=lambda name: archive.get_file_entry(name).position)
+
+    if header is None:
+        header = archives[0].header if archives else "BIG4"
+
+    file_list = sorted(sizes.items())
+    data_order = [(name, sizes[name]) for names in layout.values() for name in names]
+    with open(dest, "wb") as f:
+        entries = BaseArchive._pack_file_list(
+            f, file_list, sum(sizes.values()), len(file_list), header, data_order
+        )
+        for archive in unique:
+            archive._copy_files(layout[id(archive)], f)
+
+    logging.info(f"merged {len(file_list)} files from {len(archives)} archives")
+    return InDiskArchive(dest, entries=entries, header=header)
@@ -0,0 +1,154 @@
+import contextlib
+import logging
+import time
+from typing import Dict, Iterator, Optional
+
+
+class ArchiveObserver:
+    """Receives progress and timing events from an archive. Attach an instance to
+    an archive through its observer attribute and override the on_* methods to
+    receive the events. Archives without an observer skip all instrumentation.
+
+    The observer also counts the I/O done by the archive while it is attached.
+
+    Phases
+    -------
+    unpack
+        Reading the index of an archive
+    index
+        Writing the index of a new archive
+    data
+        Copying the file data into a new archive, reports every entry
+    fsync
+        Flushing a new archive to disk
+    move
+        Moving a new archive to its final location
+    extract
+        Extracting files to a folder, reports every entry
+    from_directory
+        Reading the files of a folder, reports every entry
+
+    Attributes
+    -----------
+    reads : int
+        Number of reads made from the archive data
+    seeks : int
+        Number of seeks made in the archive file
+    bytes_read : int
+        Number of bytes read from the archive data
+    cache_hits : int
+        Number of digests served from the hash cache
+    cache_misses : int
+        Number of digests that had to be computed
+    """
+
+    def __init__(self):
+        self.reads = 0
+        self.seeks = 0
+        self.bytes_read = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        self._phase_started: Dict[str, float] = {}
+        self._phase_bytes: Dict[str, int] = {}
+
+    def __repr__(self):
+        return (
+            f"< {type(self).__name__} reads={self.reads} seeks={self.seeks} "
+            f"bytes_read={self.bytes_read} cache_hits={self.cache_hits} >"
+        )
+
+    @contextlib.contextmanager
+    def phase(self, phase: str) -> Iterator[None]:
+        """Time a phase, notifying the observer when it starts and ends"""
+        self._phase_started[phase] = time.perf_counter()
+        self._phase_bytes[phase] = 0
+        self.on_phase_start(phase)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - self._phase_started.pop(phase)
+            self.on_phase_end(phase, elapsed, self._phase_bytes.pop(phase))
+
+    def entry(self, phase: str, name: str, size: int):
+        """Record that an entry of the given size was processed in a phase"""
+        processed = self._phase_bytes.get(phase, 0) + size
+        self._phase_bytes[phase] = processed
+
+        started = self._phase_started.get(phase)
+        elapsed = time.perf_counter() - started if started is not None else 0
+        self.on_entry(phase, name, size, processed, processed / elapsed if elapsed else 0.0)
+
+    def read(self, size: int, *, seek: bool = False):
+        """Record a read from the archive data"""
+        self.reads += 1
+        self.bytes_read += size
+        if seek:
+            self.seeks += 1
+
+    def on_phase_start(self, phase: str):
+        """Called when a phase starts
+
+        Params
+        -------
+        phase : str
+            The name of the phase
+        """
+
+    def on_phase_end(self, phase: str, elapsed: float, processed: int):
+        """Called when a phase ends
+
+        Params
+        -------
+        phase : str
+            The name of the phase
+        elapsed : float
+            Duration of the phase in seconds
+        processed : int
+            Bytes processed during the phase, only counted by phases that
+            report entries
+        """
+
+    def on_entry(self, phase: str, name: str, size: int, processed: int, throughput: float):
+        """Called every time an entry is processed during a phase
+
+        Params
+        -------
+        phase : str
+            The name of the phase
+        name : str
+            Name of the file
+        size : int
+            Size of the file
+        processed : int
+            Bytes processed since the start of the phase, including this file
+        throughput : float
+            Bytes processed per second since the start of the phase
+        """
+
+
+class LoggingObserver(ArchiveObserver):
+    """Observer logging every event, phases are logged at the INFO level and
+    entries at the DEBUG level.
+    """
+
+    def __init__(self, logger: Optional[logging.Logger] = None):
+        super().__init__()
+        self.logger = logger or logging.getLogger("pyBIG")
+
+    def on_phase_start(self, phase: str):
+        self.logger.info("%s started", phase)
+
+    def on_phase_end(self, phase: str, elapsed: float, processed: int):
+        self.logger.info("%s finished in %.3fs, %d bytes", phase, elapsed, processed)
+
+    def on_entry(self, phase: str, name: str, size: int, processed: int, throughput: float):
+        self.logger.debug("%s %s: %d bytes (%.0f B/s)", phase, name, size, throughput)
+
+
+def observe_phase(observer: Optional[ArchiveObserver], phase: str):
+    """Context manager timing a phase if there is an observer"""
+    if observer is None:
+        return contextlib.nullcontext()
+
+    return observer.phase(phase)
@@ -0,0 +1,237 @@
+import struct
+from typing import IO, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .base_archive import BaseArchive
+from .entry_table import Entry, EntryTable
+
+CHUNK_SIZE = 1024 * 1024
+
+EntryData = Union[bytes, bytearray, memoryview, Iterable[bytes], IO]
+
+
+class ArchiveWriter:
+    """Write an archive to a stream that does not need to be seekable, such as
+    a pipe, a socket or stdout. The names and sizes of all the files must be known
+    up front, the header and index are written immediately and the contents of the
+    files are then streamed one after the other with ArchiveWriter.write_entry.
+
+    Files must be written in the order of ArchiveWriter.file_list, which is sorted
+    by name like the index of every archive.
+
+    Params
+    -------
+    sink : IO
+        Anything with a write method
+    file_list : Iterable[Tuple[str, int]]
+        The name and size of every file
+    header : str
+        The type of the archive, can either be BIG4 or BIGF. Defaults to BIG4
+
+    Raises
+    ------
+        MaxSizeError
+            The archive would be bigger than supported by the BIG format
+        ValueError
+            The same file name appears more than once
+    """
+
+    def __init__(self, sink: IO, file_list: Iterable[Tuple[str, int]], header: str = "BIG4"):
+        self.sink = sink
+        self.file_list: List[Tuple[str, int]] = sorted(file_list)
+        self.header = header
+
+        names = [name for name, _ in self.file_list]
+        if len(set(names)) != len(names):
+            raise ValueError("File names must be unique")
+
+        total_size = sum(size for _, size in self.file_list)
+        self.entries: EntryTable = BaseArchive._pack_file_list(
+            sink, self.file_list, total_size, len(self.file_list), header
+        )
+        self._next = 0
+
+    def __repr__(self):
+        return f"< ArchiveWriter written={self._next}/{len(self.file_list)} >"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+
+    @property
+    def remaining(self) -> List[str]:
+        """The names of the files that still need to be written, in order"""
+        return [name for name, _ in self.file_list[self._next :]]
+
+    def write_entry(self, name: str, data: EntryData):
+        """Write the contents of the next file.
+
+        Params
+        -------
+        name : str
+            Name of the file, must be the next one in ArchiveWriter.file_list
+        data : Union[bytes, Iterable[bytes], IO]
+            The contents of the file, either as bytes, as an iterable of chunks
+            or as a file-like object to read from
+
+        Raises
+        ------
+            ValueError
+                The file is not the next one to write or the data is not the
+                size announced
+        """
+        if self._next >= len(self.file_list):
+            raise ValueError(f"File '{name}' was not announced or was already written.")
+
+        expected_name, expected_size = self.file_list[self._next]
+        if name != expected_name:
+            raise ValueError(f"Expected file '{expected_name}' but got '{name}'.")
+
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            chunks = [data]
+        elif hasattr(data, "read"):
+            chunks = iter(lambda: data.read(CHUNK_SIZE), b"")
+        else:
+            chunks = data
+
+        written = 0
+        for chunk in chunks:
+            written += len(chunk)
+            if written > expected_size:
+                raise ValueError(f"File '{name}' is bigger than {expected_size} bytes.")
+            self.sink.write(chunk)
+
+        if written != expected_size:
+            raise ValueError(f"File '{name}' is {written} bytes instead of {expected_size}.")
+
+        self._next += 1
+
+    def close(self):
+        """Check that every file was written and flush the sink
+
+        Raises
+        ------
+            ValueError
+                Some files were not written
+        """
+        if self._next != len(self.file_list):
+            raise ValueError(f"{len(self.file_list) - self._next} files were not written.")
+
+        if hasattr(self.sink, "flush"):
+            self.sink.flush()
+
+
+class _StreamReader:
+    """Keeps track of the position in a non-seekable stream along with the
+    bytes already read that may still be needed.
+    """
+
+    def __init__(self, stream: IO, chunk_size: int):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.offset = 0
+        # bytes read from history_start up to offset
+        self.history = bytearray()
+        self.history_start = 0
+
+    def read(self, size: int) -> bytes:
+        data = self.stream.read(min(size, self.chunk_size))
+        if not data:
+            raise ValueError("Archive is truncated")
+
+        self.history += data
+        self.offset += len(data)
+        return data
+
+    def read_exact(self, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            data += self.read(size - len(data))
+
+        return bytes(data)
+
+    def forget(self, before: int):
+        """Drop the bytes before an offset, they will not be needed anymore"""
+        drop = min(before, self.offset) - self.history_start
+        if drop > 0:
+            del self.history[:drop]
+            self.history_start += drop
+
+    def chunks(self, entry: Entry, keep_from: Optional[int]) -> Iterator[bytes]:
+        """Yield the data of an entry, keeping the bytes from keep_from onward"""
+        start = entry.position
+        end = entry.position + entry.size
+        self.forget(start)
+
+        if start < self.offset and end > start:
+            first = start - self.history_start
+            yield bytes(self.history[first : min(end, self.offset) - self.history_start])
+
+        while self.offset < start:
+            self.read(start - self.offset)
+            self.forget(self.offset)
+
+        while self.offset < end:
+            data = self.read(end - self.offset)
+            self.forget(end if keep_from is None else keep_from)
+            yield data
+
+
+def iter_archive(
+    stream: IO, *, chunk_size: int = CHUNK_SIZE
+) -> Iterator[Tuple[str, Iterator[bytes]]]:
+    """Read an archive sequentially from a stream that does not need to be seekable,
+    such as a pipe. Files are yielded in the order their data appears in the stream,
+    each one along with an iterator over its contents in chunks.
+
+    Each iterator must be consumed before moving on to the next file, whatever is
+    left of it is skipped otherwise. Gaps between files are skipped and only the
+    data shared by overlapping files is kept in memory.
+
+    Params
+    -------
+    stream : IO
+        Anything with a read method
+    chunk_size : int
+        Maximum size of the chunks read from the stream
+
+    Returns
+    --------
+    Iterator[Tuple[str, Iterator[bytes]]]
+        The name and contents of every file
+
+    Raises
+    ------
+        ValueError
+            The stream ends before the end of the archive
+    """
+    reader = _StreamReader(stream, chunk_size)
+    header = reader.read_exact(16)
+    file_count, index_size = struct.unpack(">II", header[8:])
+    index = bytearray(reader.read_exact(max(index_size - 16, 0)))
+
+    # index_size is not always reliable, read more until every entry is complete
+    entries = {}
+    offset = 0
+    entry_struct = struct.Struct(">II")
+    for _ in range(file_count):
+        end = index.find(b"\x00", offset + 8)
+        while end < 0:
+            index += reader.read(chunk_size)
+            end = index.find(b"\x00", offset + 8)
+
+        position, size = entry_struct.unpack_from(index, offset)
+        name = index[offset + 8 : end].decode("latin-1")
+        entries[name] = Entry(name, position, size)
+        offset = end + 1
+
+    ordered = sorted(entries.values(), key=lambda entry: (entry.position, entry.size))
+    for number, entry in enumerate(ordered):
+        keep_from = ordered[number + 1].position if number + 1 < len(ordered) else None
+        chunks = reader.chunks(entry, keep_from)
+        yield entry.name, chunks
+
+        for _ in chunks:
+            pass
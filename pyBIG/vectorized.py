@@ -0,0 +1,202 @@
+"""Vectorized encoding and decoding of archive indexes, used instead of the
+pure python loops when NumPy is installed and the index is large enough for
+the setup cost to pay off. Both paths produce identical results.
+"""
+
+import zlib
+from array import array
+from typing import List, Optional, Tuple
+
+from .entry_table import EntryTable, _rebuild_table
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+# Indexes with fewer entries than this always use the pure python path
+NUMPY_THRESHOLD = 4096
+
+
+def available(count: int) -> bool:
+    """Check whether the vectorized path should be used for an index of count entries"""
+    return numpy is not None and count >= NUMPY_THRESHOLD
+
+
+def _terminators(buf: "numpy.ndarray", count: int) -> "numpy.ndarray":
+    """Find the null byte ending the name of each entry.
+
+    Null bytes also appear inside the position and size of entries so not every
+    null byte ends a name. The terminator of an entry is the first null byte at
+    least 9 bytes after the previous terminator, which makes the terminators a
+    chain through the null bytes. Every element of that chain is found at once
+    by binary lifting over the successor of each null byte.
+    """
+    zeros = numpy.flatnonzero(buf == 0)
+    # sentinel so successors past the end of the buffer point to themselves
+    zeros = numpy.append(zeros, len(buf) + 9)
+    jump = numpy.searchsorted(zeros, zeros + 9)
+    jump[-1] = len(zeros) - 1
+
+    ranks = numpy.arange(count)
+    nodes = numpy.full(count, numpy.searchsorted(zeros, 8))
+    bit = 0
+    while (1 << bit) < count:
+        step = (ranks >> bit) & 1 == 1
+        nodes[step] = jump[nodes[step]]
+        jump = jump[jump]
+        bit += 1
+
+    terminators = zeros[nodes]
+    if count and terminators[-1] >= len(buf):
+        raise ValueError("Index is truncated")
+
+    return terminators
+
+
+def _name_mask(length: int, starts: "numpy.ndarray", ends: "numpy.ndarray") -> "numpy.ndarray":
+    """Boolean mask of the bytes in the [start, end) ranges, ranges do not overlap"""
+    marks = numpy.zeros(length + 1, dtype=numpy.int64)
+    # starts and ends are each strictly increasing so no index repeats
+    marks[starts] += 1
+    marks[ends] -= 1
+    return numpy.cumsum(marks[:-1]) > 0
+
+
+def _build_table(
+    positions: "numpy.ndarray", sizes: "numpy.ndarray", offsets: "numpy.ndarray", names: bytes
+) -> Optional[EntryTable]:
+    """Build an EntryTable straight from its columns, the hash table is filled
+    one probe at a time for every row at once. Returns None when a name is
+    duplicated, leaving it to the pure python path to merge them.
+    """
+    count = len(positions)
+    bounds = offsets.tolist()
+    name_slices = map(slice, bounds[:-1], bounds[1:])
+    hashes = numpy.fromiter(
+        map(zlib.crc32, map(memoryview(names).__getitem__, name_slices)),
+        dtype=numpy.int64,
+        count=count,
+    )
+
+    # identical names have identical hashes, only rows sharing a hash need comparing
+    order = numpy.argsort(hashes)
+    shared = numpy.flatnonzero(hashes[order][1:] == hashes[order][:-1])
+    seen = set()
+    for row in set(order[shared].tolist()) | set(order[shared + 1].tolist()):
+        name = names[bounds[row] : bounds[row + 1]]
+        if name in seen:
+            return None
+        seen.add(name)
+
+    mask = 7
+    while count * 2 > mask:
+        mask = mask * 4 + 3
+    table = numpy.zeros(mask + 1, dtype=numpy.int32)
+
+    # every pending row tries the next slot of its probe sequence, the first row
+    # of each free slot claims it and the others keep probing
+    pending = numpy.arange(count)
+    slots = hashes & mask
+    while len(pending):
+        free = table[slots] == 0
+        candidates, first = numpy.unique(slots[free], return_index=True)
+        claimed = numpy.flatnonzero(free)[first]
+        table[candidates] = pending[claimed] + 1
+
+        keep = numpy.ones(len(pending), dtype=bool)
+        keep[claimed] = False
+        pending = pending[keep]
+        slots = (slots[keep] + 1) & mask
+
+    return _rebuild_table(
+        _to_array("I", positions),
+        _to_array("I", sizes),
+        _to_array("I", offsets),
+        bytearray(names),
+        _to_array("i", table),
+        mask,
+    )
+
+
+def _to_array(typecode: str, values: "numpy.ndarray") -> array:
+    result = array(typecode)
+    result.frombytes(values.astype(numpy.dtype(typecode), copy=False).tobytes())
+    return result
+
+
+def unpack_index(index_data: bytes, count: int) -> Optional[EntryTable]:
+    """Decode the entries of an index
+
+    Params
+    -------
+    index_data : bytes
+        The index, starting at the first entry
+    count : int
+        The number of entries in the index
+
+    Returns
+    --------
+    Optional[EntryTable]
+        The entries, None if the index contains duplicate names
+    """
+    buf = numpy.frombuffer(index_data, dtype=numpy.uint8)
+    ends = _terminators(buf, count)
+    starts = numpy.concatenate(([0], ends[:-1] + 1))
+
+    headers = buf[starts[:, None] + numpy.arange(8)]
+    values = headers.view(">u4").reshape(count, 2)
+
+    lengths = ends - starts - 8
+    names = buf[_name_mask(len(buf), starts + 8, ends)].tobytes()
+    offsets = numpy.concatenate(([0], numpy.cumsum(lengths)))
+
+    return _build_table(values[:, 0], values[:, 1], offsets, names)
+
+
+def pack_index(
+    file_list: List[Tuple[str, int]], first_entry: int, offsets: Optional[List[int]] = None
+) -> Tuple[bytes, Optional[EntryTable]]:
+    """Encode the entries of an index
+
+    Params
+    -------
+    file_list : List[Tuple[str, int]]
+        The name and size of every entry, in index order
+    first_entry : int
+        Position of the first entry minus one
+    offsets : Optional[List[int]]
+        Position of the data of every entry relative to the first entry,
+        defaults to laying out the data in index order
+
+    Returns
+    --------
+    Tuple[bytes, Optional[EntryTable]]
+        The encoded entries and the resulting EntryTable, None if the
+        file list contains duplicate names
+    """
+    encoded = [name.encode("latin-1") for name, _ in file_list]
+    names = b"".join(encoded)
+    count = len(file_list)
+
+    lengths = numpy.fromiter(map(len, encoded), dtype=numpy.int64, count=count)
+    sizes = numpy.fromiter((size for _, size in file_list), dtype=numpy.int64, count=count)
+    if offsets is None:
+        positions = first_entry + 1 + numpy.cumsum(sizes) - sizes
+    else:
+        positions = first_entry + 1 + numpy.array(offsets, dtype=numpy.int64)
+
+    records = lengths + 9
+    starts = numpy.concatenate(([0], numpy.cumsum(records)[:-1]))
+    buf = numpy.zeros(int(records.sum()), dtype=numpy.uint8)
+
+    headers = numpy.empty((count, 2), dtype=">u4")
+    headers[:, 0] = positions
+    headers[:, 1] = sizes
+    buf[starts[:, None] + numpy.arange(8)] = headers.view(numpy.uint8).reshape(count, 8)
+    buf[_name_mask(len(buf), starts + 8, starts + 8 + lengths)] = numpy.frombuffer(
+        names, dtype=numpy.uint8
+    )
+
+    offsets = numpy.concatenate(([0], numpy.cumsum(lengths)))
+    return buf.tobytes(), _build_table(positions, sizes, offsets, names)
@@ -0,0 +1,187 @@
+import glob
+import os
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+
+from .base_archive import READ_GAP, BaseArchive, Entry, MaxSizeError
+from .disk_archive import InDiskArchive
+
+# header, "L253" and the byte before the first file
+VOLUME_OVERHEAD = 21
+
+
+def volume_path(path: str, number: int) -> str:
+    """Path of a volume, test.big gives test_001.big for the first volume"""
+    root, ext = os.path.splitext(path)
+    return f"{root}_{number:03d}{ext}"
+
+
+def _cost(name: str, size: int) -> int:
+    """Bytes a file takes in an archive, its data and its entry in the index"""
+    return size + len(name.encode("latin-1")) + 9
+
+
+def plan_volumes(file_list: List[Tuple[str, int]], max_size: int) -> List[List[str]]:
+    """Split files across as few volumes as possible. Directories are placed whole,
+    largest first, in the first volume they fit in. Directories bigger than a volume
+    are split into their files.
+
+    Params
+    -------
+    file_list : List[Tuple[str, int]]
+        The name and size of every file
+    max_size : int
+        Maximum size of a volume
+
+    Returns
+    --------
+    List[List[str]]
+        The sorted names of the files of every volume
+
+    Raises
+    ------
+        MaxSizeError
+            A file does not fit in a volume
+    """
+    capacity = max_size - VOLUME_OVERHEAD
+    directories: Dict[str, List[Tuple[str, int]]] = {}
+    for name, size in file_list:
+        directories.setdefault(name.rpartition("\\")[0], []).append((name, size))
+
+    items = []
+    for files in directories.values():
+        total = sum(_cost(name, size) for name, size in files)
+        if total <= capacity:
+            items.append((total, [name for name, _ in files]))
+            continue
+
+        for name, size in files:
+            if _cost(name, size) > capacity:
+                raise MaxSizeError(f"File '{name}' does not fit in a volume of {max_size} bytes")
+            items.append((_cost(name, size), [name]))
+
+    items.sort(key=lambda item: (-item[0], item[1][0]))
+    volumes: List[Tuple[int, List[str]]] = []
+    for cost, names in items:
+        for number, (used, volume) in enumerate(volumes):
+            if used + cost <= capacity:
+                volume.extend(names)
+                volumes[number] = (used + cost, volume)
+                break
+        else:
+            volumes.append((cost, list(names)))
+
+    return [sorted(volume) for _, volume in volumes]
+
+
+class VolumeSet:
+    """Read-only view of several archives as a single one, such as the volumes
+    written by BaseArchive.save_volumes. When a file is in several volumes the
+    last one wins.
+
+    Params
+    -------
+    volumes : List[BaseArchive]
+        The archives of the set
+    """
+
+    def __init__(self, volumes: List[BaseArchive]):
+        self.volumes = volumes
+        self._volume_of: Dict[str, BaseArchive] = {}
+        for volume in volumes:
+            for name in volume.file_list():
+                self._volume_of[name] = volume
+
+    def __repr__(self):
+        return f"< VolumeSet volumes={len(self.volumes)} entries={len(self._volume_of)} >"
+
+    def volume_of(self, name: str) -> BaseArchive:
+        """Get the volume a file is read from
+
+        Raises
+        ------
+            KeyError
+                File not found
+        """
+        if name not in self._volume_of:
+            raise KeyError(f"File '{name}' does not exist.")
+
+        return self._volume_of[name]
+
+    def file_exists(self, name: str) -> bool:
+        """See BaseArchive.file_exists"""
+        return name in self._volume_of
+
+    def file_list(self) -> List[str]:
+        """See BaseArchive.file_list"""
+        return sorted(self._volume_of)
+
+    def get_file_entry(self, name: str) -> Entry:
+        """See BaseArchive.get_file_entry, the position is within the volume"""
+        return self.volume_of(name).get_file_entry(name)
+
+    def read_file(self, name: str) -> bytes:
+        """See BaseArchive.read_file"""
+        return self.volume_of(name).read_file(name)
+
+    def iter_files(
+        self, names: Iterable[str] = None, *, gap: int = READ_GAP
+    ) -> Iterator[Tuple[str, bytes]]:
+        """See BaseArchive.iter_files, files are read one volume after the other"""
+        for volume, volume_names in self._group(names):
+            yield from volume.iter_files(volume_names, gap=gap)
+
+    def read_files(self, names: Iterable[str], *, gap: int = READ_GAP) -> Dict[str, bytes]:
+        """See BaseArchive.read_files"""
+        return dict(self.iter_files(names, gap=gap))
+
+    def extract(self, output: str, *, files: List[str] = None):
+        """See BaseArchive.extract"""
+        for volume, names in self._group(files):
+            volume.extract(output, files=names)
+
+    def _group(self, names: Iterable[str] = None) -> List[Tuple[BaseArchive, List[str]]]:
+        """Group files by the volume they are read from, in the order of the volumes"""
+        if names is None:
+            names = self.file_list()
+
+        groups: Dict[int, List[str]] = {id(volume): [] for volume in self.volumes}
+        for name in dict.fromkeys(names):
+            groups[id(self.volume_of(name))].append(name)
+
+        return [(volume, groups[id(volume)]) for volume in self.volumes if groups[id(volume)]]
+
+
+def open_volume_set(paths: Union[str, List[str]]) -> VolumeSet:
+    """Open the volumes written by BaseArchive.save_volumes as a single archive
+
+    Params
+    -------
+    paths : Union[str, List[str]]
+        Either the path given to BaseArchive.save_volumes or the paths of
+        every volume
+
+    Returns
+    --------
+    VolumeSet
+        The volumes
+
+    Raises
+    ------
+        ValueError
+            No volume found
+    """
+    if isinstance(paths, str):
+        root, ext = os.path.splitext(paths)
+        numbers = {}
+        for path in glob.glob(f"{glob.escape(root)}_[0-9]*{glob.escape(ext)}"):
+            # volumes past 999 have more than three digits
+            number = path[len(root) + 1 : len(path) - len(ext)]
+            if number.isdigit():
+                numbers[path] = int(number)
+
+        paths = sorted(numbers, key=numbers.__getitem__)
+
+    if not paths:
+        raise ValueError("No volume found")
+
+    return VolumeSet([InDiskArchive(path) for path in paths])
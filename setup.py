@@ -21,6 +21,7 @@ setup(
     long_description_content_type="text/markdown",
     long_description=readme,
     python_requires='>=3.8',
+    extras_require={"numpy": ["numpy"]},
     classifiers=[
         "License :: OSI Approved :: MIT License",
         "Intended Audience :: Developers",
@@ -0,0 +1,259 @@
+"""Reproducible benchmarks over synthetic archives.
+
+Run from the root directory:
+    python -m tests.benchmarks --counts 1000 10000 --output bench.json
+
+Every archive is generated from a fixed seed so the same arguments always
+produce the same archives, allowing results to be compared between versions.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import unittest
+from typing import Callable, Dict, List, Optional
+
+import pyBIG
+from pyBIG import ArchiveWriter, InDiskArchive, InMemoryArchive, refpack
+
+SIZE_DISTRIBUTIONS = {
+    # typical ini/str files
+    "small": lambda rng: rng.randint(64, 4096),
+    # mostly small files with a long tail of textures and models
+    "mixed": lambda rng: min(int(rng.lognormvariate(7.5, 1.5)), 4_000_000),
+    "large": lambda rng: rng.randint(64_000, 1_000_000),
+}
+
+WORDS = [
+    b"Weapon",
+    b"Object",
+    b"Damage",
+    b"Armor",
+    b"FireSound",
+    b"AttackRange",
+    b"End",
+    b"\r\n",
+    b"    ",
+    b"= ",
+]
+
+
+def random_bytes(rng: random.Random, size: int) -> bytes:
+    return rng.getrandbits(size * 8).to_bytes(size, "little") if size else b""
+
+
+def generate_content(rng: random.Random, size: int, compressibility: float) -> bytes:
+    """Generate data where roughly `compressibility` of the bytes are ini-like
+    text and the rest are random.
+    """
+    text_size = int(size * compressibility)
+    text = bytearray()
+    while len(text) < text_size:
+        text += rng.choice(WORDS)
+
+    return bytes(text[:text_size]) + random_bytes(rng, size - text_size)
+
+
+def generate_archive(
+    path: str,
+    count: int,
+    distribution: str = "small",
+    compressibility: float = 0.5,
+    seed: int = 0,
+) -> Dict[str, int]:
+    """Write a deterministic archive to path and return the names and sizes
+    of its files. Files are generated one at a time so archives larger than
+    the available memory can be generated.
+    """
+    rng = random.Random(f"{seed}-{count}-{distribution}-{compressibility}")
+    size_of = SIZE_DISTRIBUTIONS[distribution]
+    sizes = {f"data\\dir{index % 97}\\file{index}.ini": size_of(rng) for index in range(count)}
+
+    with open(path, "wb") as f, ArchiveWriter(f, sizes.items()) as writer:
+        for name, size in writer.file_list:
+            writer.write_entry(name, generate_content(rng, size, compressibility))
+
+    return sizes
+
+
+def measure(func: Callable[[], object], repeat: int, setup: Callable[[], None] = None) -> dict:
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return {"min": min(timings), "median": statistics.median(timings), "runs": repeat}
+
+
+def bench_archive(
+    path: str, sizes: Dict[str, int], tmp_dir: str, repeat: int, reads: int
+) -> Dict[str, Dict[str, dict]]:
+    rng = random.Random(0)
+    names = sorted(sizes)
+    sample = rng.sample(names, min(reads, len(names)))
+    extract_sample = names[: min(reads, len(names))]
+    extract_dir = os.path.join(tmp_dir, "extract")
+    save_path = os.path.join(tmp_dir, "saved.big")
+
+    with open(path, "rb") as f:
+        data = f.read()
+
+    results = {}
+    for cls in [InMemoryArchive, InDiskArchive]:
+        if cls is InMemoryArchive:
+            archive = InMemoryArchive(data)
+        else:
+            work_path = os.path.join(tmp_dir, "work.big")
+            shutil.copyfile(path, work_path)
+            archive = InDiskArchive(work_path)
+
+        def edit():
+            archive.edit_file(names[0], b"edited")
+
+        def unpack():
+            with open(path, "rb") as f:
+                cls._unpack(f)
+
+        def save():
+            if cls is InMemoryArchive:
+                archive.save(save_path)
+            else:
+                archive.save()
+
+        def clean_extract():
+            shutil.rmtree(extract_dir, ignore_errors=True)
+
+        results[cls.__name__] = {
+            "_unpack": measure(unpack, repeat),
+            "file_list": measure(archive.file_list, repeat),
+            "read_file": measure(lambda: [archive.read_file(name) for name in sample], repeat),
+            "extract": measure(
+                lambda: archive.extract(extract_dir, files=extract_sample), repeat, clean_extract
+            ),
+            "repack": measure(archive.repack, repeat, edit),
+            "save": measure(save, repeat, edit),
+        }
+
+    return results
+
+
+def bench_refpack(repeat: int, size: int) -> Dict[str, dict]:
+    rng = random.Random(0)
+    results = {}
+    for compressibility in [0.0, 0.5, 1.0]:
+        data = generate_content(rng, size, compressibility)
+        compressed = refpack.compress(data)
+        results[f"compressibility={compressibility}"] = {
+            "ratio": len(compressed) / len(data),
+            "compress": measure(lambda: refpack.compress(data), repeat),
+            "decompress": measure(lambda: refpack.decompress(compressed), repeat),
+        }
+
+    return results
+
+
+def run(
+    counts: List[int],
+    distributions: List[str],
+    compressibility: float = 0.5,
+    repeat: int = 3,
+    reads: int = 1000,
+    refpack_size: int = 65536,
+    seed: int = 0,
+) -> dict:
+    report = {
+        "version": pyBIG.__version__,
+        "python": sys.version,
+        "platform": platform.platform(),
+        "parameters": {
+            "counts": counts,
+            "distributions": distributions,
+            "compressibility": compressibility,
+            "repeat": repeat,
+            "reads": reads,
+            "refpack_size": refpack_size,
+            "seed": seed,
+        },
+        "archives": [],
+        "refpack": bench_refpack(repeat, refpack_size),
+    }
+
+    for count in counts:
+        for distribution in distributions:
+            tmp_dir = tempfile.mkdtemp(prefix="pyBIG-bench-")
+            try:
+                path = os.path.join(tmp_dir, "source.big")
+                sizes = generate_archive(path, count, distribution, compressibility, seed)
+                report["archives"].append(
+                    {
+                        "entries": count,
+                        "distribution": distribution,
+                        "archive_size": os.path.getsize(path),
+                        "results": bench_archive(path, sizes, tmp_dir, repeat, reads),
+                    }
+                )
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return report
+
+
+class BenchmarkTests(unittest.TestCase):
+    def test_generation_is_deterministic(self):
+        rng = random.Random(0)
+        first = generate_content(rng, 1000, 0.5)
+        rng = random.Random(0)
+        self.assertEqual(first, generate_content(rng, 1000, 0.5))
+
+    def test_run(self):
+        report = run([10], ["small"], repeat=1, reads=5, refpack_size=256)
+        json.dumps(report)
+
+        results = report["archives"][0]["results"]
+        self.assertEqual(set(results), {"InMemoryArchive", "InDiskArchive"})
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark pyBIG on synthetic archives")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument(
+        "--distributions", nargs="+", default=["small", "mixed"], choices=SIZE_DISTRIBUTIONS
+    )
+    parser.add_argument("--compressibility", type=float, default=0.5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--reads", type=int, default=1000)
+    parser.add_argument("--refpack-size", type=int, default=65536)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="File to write the JSON results to, defaults to stdout")
+    args = parser.parse_args(argv)
+
+    report = run(
+        args.counts,
+        args.distributions,
+        args.compressibility,
+        args.repeat,
+        args.reads,
+        args.refpack_size,
+        args.seed,
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,36 @@
+import asyncio
+import gc
+import io
 import logging
 import os
+import pickle
 import random
+import shutil
 import string
+import tempfile
+import threading
+import time
 import unittest
 import uuid
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
 from typing import Union
 
-from pyBIG import InDiskArchive, InMemoryArchive, base_archive
+from pyBIG import (
+    ArchiveObserver,
+    ArchiveWriter,
+    AsyncArchive,
+    InDiskArchive,
+    InMemoryArchive,
+    base_archive,
+    iter_archive,
+    merge_archives,
+    open_volume_set,
+    vectorized,
+)
+from pyBIG.entry_table import Entry, EntryTable
+from pyBIG.fastcopy import copy_range
 from pyBIG.refpack import compress, decompress, has_refpack_header
 
 logging.basicConfig(level=logging.INFO)
@@ -22,6 +46,25 @@ def string_generator(length: int) -> str:
     return "".join(random.choices(string.ascii_uppercase + string.digits, k=length))
 
 
+def read_in_worker(archive: base_archive.BaseArchive, name: str) -> bytes:
+    return archive.read_file(name)
+
+
+class RecordingObserver(ArchiveObserver):
+    def __init__(self):
+        super().__init__()
+        self.events = []
+
+    def on_phase_start(self, phase):
+        self.events.append(("start", phase))
+
+    def on_phase_end(self, phase, elapsed, processed):
+        self.events.append(("end", phase, processed))
+
+    def on_entry(self, phase, name, size, processed, throughput):
+        self.events.append(("entry", phase, name, size))
+
+
 class BaseTestCases:
     class BaseTest(unittest.TestCase):
         archive: Union[InMemoryArchive, InDiskArchive]
@@ -39,6 +82,8 @@ class BaseTestCases:
                 TEST_ARCHIVE,
                 "tests/test_data/test_big_type.big",
                 "tests/test_data/test_offset.big",
+                "tests/test_data/test_hashes.json",
+                "tests/test_data/test_delta.big",
             ]:
                 try:
                     os.remove(file)
@@ -94,6 +139,23 @@ class BaseTestCases:
             new_archive.save("tests/test_data/output/test.big")
             self.assertTrue(os.path.exists("tests/test_data/output/test.big"))
 
+        def test_extract_pending(self):
+            output = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, output, True)
+            archive = self.empty()
+            values = {f"data\\{x}.bin": os.urandom(x * 1000) for x in range(5)}
+            for name, content in values.items():
+                archive.add_file(name, content)
+            archive.repack()
+            archive.edit_file("data\\2.bin", b"edited")
+            archive.copy_file("data\\3.bin", "data\\copy.bin")
+            values.update({"data\\2.bin": b"edited", "data\\copy.bin": values["data\\3.bin"]})
+
+            archive.extract(output)
+            for name, content in values.items():
+                with open(os.path.join(output, *name.split("\\")), "rb") as f:
+                    self.assertEqual(f.read(), content)
+
         def test_utils(self):
             file_list = self.archive.file_list()
             self.archive.get_file_entry(file_list[0])
@@ -111,6 +173,288 @@ class BaseTestCases:
             data = self.archive.bytes()
             self.assertIsInstance(data, bytes)
 
+        def test_file_hash(self):
+            with open(f"tests/test_data/{TEST_FILE}", "rb") as f:
+                expected = format(zlib.crc32(f.read()), "08x")
+
+            self.assertEqual(self.archive.file_hash(TEST_FILE), expected)
+            self.assertEqual(len(self.archive.file_hash(TEST_FILE, "blake2b")), 128)
+
+            self.archive.edit_file(TEST_FILE, TEST_CONTENT.encode(TEST_ENCODING))
+            edited = format(zlib.crc32(TEST_CONTENT.encode(TEST_ENCODING)), "08x")
+            self.assertEqual(self.archive.file_hash(TEST_FILE), edited)
+
+            self.archive.repack()
+            self.assertEqual(self.archive.file_hashes(), {TEST_FILE: edited})
+
+            self.archive.save_hashes("tests/test_data/test_hashes.json")
+            self.archive._hash_cache = {}
+            self.assertEqual(self.archive.load_hashes("tests/test_data/test_hashes.json"), 1)
+            self.assertEqual(self.archive.file_hash(TEST_FILE), edited)
+
+        def test_diff(self):
+            other = InMemoryArchive(self.archive.bytes())
+            self.assertEqual(self.archive.diff(other), ([], [], []))
+
+            other.add_file("removed.txt", b"removed")
+            other.edit_file(TEST_FILE, string_generator(50).encode(TEST_ENCODING))
+            self.archive.add_file("added.txt", b"added")
+
+            diff = self.archive.diff(other)
+            self.assertEqual(diff.added, ["added.txt"])
+            self.assertEqual(diff.removed, ["removed.txt"])
+            self.assertEqual(diff.changed, [TEST_FILE])
+
+            self.archive.export_delta(other, "tests/test_data/test_delta.big")
+            delta = InDiskArchive("tests/test_data/test_delta.big")
+            self.assertEqual(delta.file_list(), ["added.txt", TEST_FILE])
+            self.assertEqual(delta.read_file("added.txt"), b"added")
+            self.assertEqual(delta.read_file(TEST_FILE), self.archive.read_file(TEST_FILE))
+
+        def test_sync_to(self):
+            output = "tests/test_data/sync_output"
+            self.addCleanup(shutil.rmtree, output, True)
+
+            for compare in ["hash", "mtime"]:
+                report = self.archive.sync_to(output, compare=compare)
+                self.assertEqual(report.written, [TEST_FILE])
+
+                report = self.archive.sync_to(output, compare=compare)
+                self.assertEqual(report, ([], []))
+
+                with open(os.path.join(output, TEST_FILE), "r+b") as f:
+                    f.write(b"x")
+                with open(os.path.join(output, "stray.txt"), "wb") as f:
+                    f.write(b"stray")
+
+                report = self.archive.sync_to(output, delete=True, compare="hash")
+                self.assertEqual(report.written, [TEST_FILE])
+                self.assertEqual(report.deleted, [os.path.join(output, "stray.txt")])
+                shutil.rmtree(output)
+
+        def test_update_from_directory(self):
+            output = "tests/test_data/update_output"
+            self.addCleanup(shutil.rmtree, output, True)
+            self.archive.extract(output)
+
+            report = self.archive.update_from_directory(output)
+            self.assertEqual(report, ([], [], []))
+            self.assertEqual(self.archive.modified_entries, {})
+
+            os.makedirs(os.path.join(output, "data"))
+            with open(os.path.join(output, "data", "added.txt"), "wb") as f:
+                f.write(b"added")
+            with open(os.path.join(output, TEST_FILE), "wb") as f:
+                f.write(TEST_CONTENT.encode(TEST_ENCODING))
+
+            report = self.archive.update_from_directory(output)
+            self.assertEqual(report, (["data\\added.txt"], [TEST_FILE], []))
+            self.assertEqual(self.archive.read_file("data\\added.txt"), b"added")
+
+            os.remove(os.path.join(output, TEST_FILE))
+            report = self.archive.update_from_directory(output)
+            self.assertEqual(report, ([], [], [TEST_FILE]))
+            self.assertFalse(self.archive.file_exists(TEST_FILE))
+
+        def test_observer(self):
+            observer = RecordingObserver()
+            self.archive.observer = observer
+            size = self.archive.get_file_entry(TEST_FILE).size
+
+            self.archive.add_file("added.txt", b"added")
+            self.archive.remove_file("added.txt")
+            self.archive.repack()
+            self.assertIn(("entry", "data", TEST_FILE, size), observer.events)
+            self.assertIn(("end", "data", size), observer.events)
+            self.assertEqual(observer.bytes_read, size)
+
+            self.archive.file_hash(TEST_FILE)
+            self.archive.file_hash(TEST_FILE)
+            self.assertEqual((observer.cache_hits, observer.cache_misses), (1, 1))
+            self.assertEqual(observer.reads, 2)
+
+        def test_read_files(self):
+            archive = self.empty()
+            values = {f"file{x}.txt": string_generator(50).encode("utf-8") for x in range(10)}
+            for name, content in values.items():
+                archive.add_file(name, content)
+            archive.repack()
+            archive.add_file("pending.txt", b"pending")
+
+            observer = ArchiveObserver()
+            archive.observer = observer
+            names = ["file3.txt", "pending.txt", *values, "file3.txt"]
+            self.assertEqual(archive.read_files(names), {**values, "pending.txt": b"pending"})
+            self.assertEqual(observer.reads, 1)
+
+            self.assertEqual(archive.read_files(values, gap=-1), values)
+            self.assertEqual(observer.reads, 11)
+            self.assertEqual([name for name, _ in archive.iter_files()][0], "pending.txt")
+
+            with self.assertRaises(KeyError):
+                archive.read_files(["missing.txt"])
+
+        def test_layout(self):
+            archive = self.empty()
+            values = {f"file{x}.txt": string_generator(10 + x).encode("utf-8") for x in range(5)}
+            for name, content in values.items():
+                archive.add_file(name, content)
+            archive.repack()
+
+            archive.start_trace()
+            archive.read_file("file3.txt")
+            archive.read_file("file1.txt")
+            archive.read_file("file3.txt")
+            trace = archive.stop_trace()
+            self.assertEqual(trace, ["file3.txt", "file1.txt"])
+
+            archive.edit_file("file1.txt", b"edited")
+            values["file1.txt"] = b"edited"
+            archive.repack(layout=[*trace, "missing.txt"])
+
+            order = sorted(archive.entries, key=lambda name: archive.entries[name].position)
+            self.assertEqual(
+                order, ["file3.txt", "file1.txt", "file0.txt", "file2.txt", "file4.txt"]
+            )
+            self.assertEqual(list(archive.entries), sorted(values))
+            self.assertEqual(archive.read_files(values), values)
+
+        def test_rename(self):
+            with open(f"tests/test_data/{TEST_FILE}", "rb") as f:
+                content = f.read()
+
+            archive = self.empty()
+            archive.add_file(TEST_FILE, content)
+            archive.repack()
+
+            observer = ArchiveObserver()
+            archive.observer = observer
+            archive.file_hash(TEST_FILE)
+            archive.rename_file(TEST_FILE, "data\\ini\\renamed.txt")
+            archive.copy_file("data\\ini\\renamed.txt", "data\\copy.txt")
+            archive.add_file("data\\ini\\added.txt", b"added")
+            self.assertEqual(observer.reads, 1)
+            self.assertEqual(archive.archive_memory_size(), 5)
+            self.assertEqual(archive.read_file("data\\copy.txt"), content)
+
+            with self.assertRaises(KeyError):
+                archive.rename_file("data\\copy.txt", "data\\ini\\added.txt")
+
+            moved = archive.move_dir("data\\ini", "data\\moved\\")
+            self.assertEqual(
+                moved,
+                {
+                    "data\\ini\\added.txt": "data\\moved\\added.txt",
+                    "data\\ini\\renamed.txt": "data\\moved\\renamed.txt",
+                },
+            )
+            self.assertEqual(
+                archive.file_list(),
+                ["data\\copy.txt", "data\\moved\\added.txt", "data\\moved\\renamed.txt"],
+            )
+
+            archive.repack()
+            self.assertEqual(observer.cache_misses, 1)
+            self.assertEqual(archive.read_file("data\\moved\\added.txt"), b"added")
+            self.assertEqual(archive.read_file("data\\moved\\renamed.txt"), content)
+            self.assertEqual(archive.read_file("data\\copy.txt"), content)
+            self.assertEqual(
+                archive.file_hashes(["data\\copy.txt"]),
+                {"data\\copy.txt": format(zlib.crc32(content), "08x")},
+            )
+            self.assertEqual(observer.cache_hits, 1)
+
+            archive.rename_file("data\\copy.txt", TEST_FILE)
+            archive.move_dir("data\\moved", "data")
+            archive.repack()
+            self.assertEqual(
+                archive.file_list(), ["data\\added.txt", "data\\renamed.txt", TEST_FILE]
+            )
+
+        def test_hash_renamed(self):
+            output = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, output, True)
+            archive = self.empty()
+            archive.add_file("data\\a.ini", b"a" * 10)
+            archive.add_file("data\\b.ini", b"b" * 10)
+            archive.repack()
+            archive.extract(output)
+
+            archive.rename_file("data\\a.ini", "data\\c.ini")
+            archive.copy_file("data\\b.ini", "data\\d.ini")
+            self.assertEqual(archive.file_hash("data\\c.ini"), base_archive.hash_data(b"a" * 10))
+            self.assertEqual(archive.file_hash("data\\d.ini"), base_archive.hash_data(b"b" * 10))
+
+            archive = self.empty()
+            archive.add_file("x.bin", b"x" * 10)
+            archive.repack()
+            archive.extract(output)
+            archive.rename_file("x.bin", "z.bin")
+            os.rename(os.path.join(output, "x.bin"), os.path.join(output, "z.bin"))
+            report = archive.sync_to(output)
+            self.assertEqual(report.written, [])
+
+        def test_verify(self):
+            self.assertEqual(self.archive.verify(refpack=True), (None, None, [], [], [], {}))
+
+            archive = self.empty()
+            valid = compress(b"valid" * 100)
+            corrupt = bytearray(compress(b"corrupt" * 100))
+            corrupt[3] ^= 1
+            archive.add_file("valid.bin", valid)
+            archive.add_file("corrupt.bin", bytes(corrupt))
+            archive.repack()
+
+            report = archive.verify(refpack=True, workers=2)
+            self.assertEqual(report.corrupt.keys(), {"corrupt.bin"})
+            self.assertEqual(report.out_of_bounds, [])
+
+            # pending modifications are not checked
+            archive.remove_file("valid.bin")
+            archive.edit_file("corrupt.bin", valid)
+            report = archive.verify(refpack=True, workers=2)
+            self.assertEqual(report.corrupt.keys(), {"corrupt.bin"})
+
+        def test_search(self):
+            archive = self.empty()
+            archive.add_file("data\\ini\\weapon.ini", b"Weapon Sword\nWeapon Bow\n")
+            archive.add_file("data\\ini\\object.ini", compress(b"Object Archer\nWeapon Bow\n" * 10))
+            archive.add_file("data\\art\\weapon.tga", b"Weapon Bow")
+            archive.repack()
+            archive.add_file("data\\ini\\pending.ini", b"Bow")
+
+            matches = list(archive.search(rb"Bow", names="data\\ini\\*.ini", workers=2))
+            self.assertEqual(
+                sorted(matches),
+                [("data\\ini\\object.ini", 21 + x * 25) for x in range(10)]
+                + [("data\\ini\\pending.ini", 0), ("data\\ini\\weapon.ini", 20)],
+            )
+            self.assertEqual(matches[0], ("data\\ini\\pending.ini", 0))
+            self.assertEqual(len(list(archive.search("Weapon"))), 13)
+
+        def test_compression(self):
+            archive = self.empty()
+            text = b"Object GondorArcher\n  Weapon = GondorBow\nEnd\n" * 50
+            archive.add_file("data\\ini\\archer.ini", text)
+            archive.add_file("data\\ini\\empty.ini", b"")
+            archive.add_file("data\\ini\\packed.ini", compress(text))
+            archive.add_file("data\\art\\noise.tga", os.urandom(2000))
+            archive.repack()
+
+            report = archive.analyze_compression(workers=2)
+            self.assertEqual(report.compressed, ["data\\ini\\packed.ini"])
+            self.assertEqual(report.compressed_size, len(compress(text)))
+            self.assertEqual(report.extensions.keys(), {".ini", ".tga"})
+            self.assertEqual(report.extensions[".ini"][:2], (1, len(text)))
+            self.assertGreater(report.extensions[".tga"].ratio, 1)
+            self.assertEqual([c.name for c in report.candidates], ["data\\ini\\archer.ini"])
+
+            saved = archive.recompress(report.candidates, workers=2)
+            self.assertEqual(saved, {"data\\ini\\archer.ini": len(text) - len(compress(text))})
+            self.assertEqual(archive.modified_entries, {})
+            self.assertEqual(decompress(archive.read_file("data\\ini\\archer.ini")), text)
+            self.assertEqual(archive.recompress(["data\\art\\noise.tga"]), {})
+
         def test_offsets(self):
             archive: base_archive.BaseArchive = self.empty()
             SIZE = 25
@@ -184,6 +528,107 @@ class TestArchive(BaseTestCases.BaseTest):
             self.assertEqual(archive.header, header)
             os.remove("tests/test_data/test_big_type.big")
 
+    def test_load_hashes_other_content(self):
+        path = "tests/test_data/test_hashes.json"
+        archive = InMemoryArchive.empty()
+        archive.add_file("a.bin", b"a" * 10)
+        archive.repack()
+        other = InMemoryArchive.empty()
+        other.add_file("a.bin", b"b" * 10)
+        other.repack()
+
+        archive.file_hash("a.bin")
+        archive.save_hashes(path)
+        self.assertEqual(archive.load_hashes(path), 1)
+        self.assertEqual(other.load_hashes(path), 0)
+        self.assertEqual(other.file_hash("a.bin"), base_archive.hash_data(b"b" * 10))
+
+    def test_snapshot(self):
+        self.archive.add_file("pending.txt", b"pending")
+        snapshot = self.archive.snapshot()
+        self.assertIs(snapshot.archive.getvalue(), self.archive.archive.getvalue())
+        self.assertIs(snapshot.entries, self.archive.entries)
+
+        snapshot.edit_file(TEST_FILE, b"edited")
+        snapshot.remove_file("pending.txt")
+        snapshot.repack()
+        self.assertEqual(snapshot.file_list(), [TEST_FILE])
+        self.assertEqual(snapshot.read_file(TEST_FILE), b"edited")
+
+        self.assertEqual(self.archive.read_file("pending.txt"), b"pending")
+        with open(f"tests/test_data/{TEST_FILE}", "rb") as f:
+            self.assertEqual(self.archive.read_file(TEST_FILE), f.read())
+
+    def test_shared_memory(self):
+        self.archive.add_file("large.txt", b"large" * 10000)
+        self.archive.repack()
+        self.archive.add_file("pending.txt", b"pending")
+        self.archive.share_memory()
+        self.addCleanup(self.archive.release_memory)
+        self.assertTrue(self.archive.shared_memory)
+
+        data = pickle.dumps(self.archive)
+        self.assertLess(len(data), len(self.archive.archive.getvalue()))
+
+        copy = pickle.loads(data)
+        self.assertEqual(copy.file_list(), self.archive.file_list())
+        self.assertEqual(copy.read_file(TEST_FILE), self.archive.read_file(TEST_FILE))
+        snapshot = self.archive.snapshot()
+        self.assertEqual(snapshot.archive.memory.name, self.archive.archive.memory.name)
+        self.assertEqual(snapshot.read_file("pending.txt"), b"pending")
+        snapshot.release_memory()
+        self.assertTrue(self.archive.shared_memory)
+
+        copy.release_memory()
+        self.assertFalse(copy.shared_memory)
+        self.assertEqual(copy.read_file(TEST_FILE), self.archive.read_file(TEST_FILE))
+
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(read_in_worker, self.archive, TEST_FILE).result()
+        self.assertEqual(result, self.archive.read_file(TEST_FILE))
+
+        self.archive.repack()
+        self.assertFalse(self.archive.shared_memory)
+        self.assertEqual(self.archive.read_file("pending.txt"), b"pending")
+
+    def test_shared_memory_lifetime(self):
+        self.archive.share_memory()
+
+        # repacking mid-iteration keeps the data being read alive
+        files = self.archive.iter_files()
+        self.assertEqual(next(files)[0], TEST_FILE)
+        self.archive.edit_file(TEST_FILE, b"edited")
+        self.archive.repack()
+        self.assertEqual(list(files), [])
+        self.assertEqual(self.archive.read_file(TEST_FILE), b"edited")
+
+        self.archive.share_memory()
+        name = self.archive.archive.memory.name
+        self.archive = None
+        gc.collect()
+        with self.assertRaises(FileNotFoundError):
+            SharedMemory(name)
+
+    def test_verify_damaged(self):
+        entries = [("a", 75, 10), ("b", 80, 10), ("a", 90, 5), ("c", 95, 100), ("d", 10, 5)]
+        index = b"".join(
+            position.to_bytes(4, "big") + size.to_bytes(4, "big") + name.encode() + b"\x00"
+            for name, position, size in entries
+        )
+        header = b"BIG4" + (200).to_bytes(4, "little") + len(entries).to_bytes(4, "big")
+        data = header + (20 + len(index)).to_bytes(4, "big") + index + b"L253\x00"
+        data += b"\x00" * (100 - len(data))
+
+        report = InMemoryArchive(data).verify()
+        self.assertIsNone(report.header_error)
+        self.assertEqual(report.size_mismatch, (200, 100))
+        self.assertEqual(report.out_of_bounds, ["c", "d"])
+        self.assertEqual(report.overlapping, [("a", "b")])
+        self.assertEqual(report.duplicates, ["a"])
+
+        report = InMemoryArchive(b"BIGX" + data[4:]).verify()
+        self.assertEqual(report.header_error, "Unknown header b'BIGX'")
+
 
 class TestLargeArchive(BaseTestCases.BaseTest):
     def setUp(self):
@@ -222,6 +667,418 @@ class TestLargeArchive(BaseTestCases.BaseTest):
             self.assertEqual(archive.header, header)
             os.remove("tests/test_data/test_big_type.big")
 
+    def test_spool(self):
+        archive = InDiskArchive.empty(file_path=TEST_ARCHIVE, spool_threshold=100)
+        values = {f"file{x}.txt": string_generator(60).encode("utf-8") for x in range(5)}
+        for name, content in values.items():
+            archive.add_file(name, content)
+
+        self.assertEqual(len(archive._spooled), 4)
+        self.assertEqual(archive.archive_memory_size(), 60)
+        self.assertIsNone(archive.modified_entries["file0.txt"].content)
+        self.assertEqual(archive.read_file("file0.txt"), values["file0.txt"])
+
+        archive.edit_file("file0.txt", b"edited")
+        archive.remove_file("file1.txt")
+        values["file0.txt"] = b"edited"
+        del values["file1.txt"]
+        self.assertNotIn("file0.txt", archive._spooled)
+        self.assertEqual(archive.read_files(values), values)
+
+        archive.save()
+        self.assertIsNone(archive._spool)
+        archive = InDiskArchive(TEST_ARCHIVE)
+        self.assertEqual(archive.read_files(values), values)
+
+        with InDiskArchive(TEST_ARCHIVE, spool_threshold=0) as archive:
+            archive.add_file("spooled.txt", b"spooled")
+            self.assertIsNotNone(archive._spool)
+        self.assertIsNone(archive._spool)
+        self.assertFalse(archive.file_exists("spooled.txt"))
+        self.assertEqual(archive.archive_memory_size(), 0)
+
+    def test_auto_commit(self):
+        commits = []
+        archive = InDiskArchive.empty(
+            file_path=TEST_ARCHIVE,
+            auto_commit_bytes=100,
+            on_auto_commit=lambda archive, size: commits.append(size),
+        )
+
+        archive.add_file("a.txt", b"a" * 60)
+        archive.edit_file("a.txt", b"a" * 30)
+        archive.add_file("b.txt", b"b" * 60)
+        archive.remove_file("b.txt")
+        self.assertEqual(archive.archive_memory_size(), 30)
+        self.assertEqual(commits, [])
+
+        archive.add_file("c.txt", b"c" * 80)
+        self.assertEqual(commits, [110])
+        self.assertEqual(archive.modified_entries, {})
+        self.assertEqual(archive.archive_memory_size(), 0)
+        self.assertEqual(InDiskArchive(TEST_ARCHIVE).file_list(), ["a.txt", "c.txt"])
+
+        source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source, True)
+        for name in ("a.txt", "b.txt"):
+            with open(os.path.join(source, name), "wb") as f:
+                f.write(b"x" * 60)
+
+        commits.clear()
+        archive = InDiskArchive.from_directory(
+            source,
+            file_path=TEST_ARCHIVE,
+            auto_commit_bytes=100,
+            on_auto_commit=lambda archive, size: commits.append(size),
+        )
+        self.assertEqual(commits, [120])
+        self.assertEqual(archive.file_list(), ["a.txt", "b.txt"])
+
+    def test_pickle(self):
+        archive = InDiskArchive.empty(file_path=TEST_ARCHIVE, spool_threshold=0)
+        self.addCleanup(archive.close)
+        archive.add_file("stored.txt", b"stored")
+        archive.save()
+        archive.observer = ArchiveObserver()
+        archive.on_auto_commit = lambda archive, size: None
+        archive.add_file("pending.txt", b"pending")
+        self.assertIn("pending.txt", archive._spooled)
+
+        copy = pickle.loads(pickle.dumps(archive))
+        self.assertEqual(copy.entries, archive.entries)
+        self.assertEqual(copy.read_file("stored.txt"), b"stored")
+        self.assertEqual(copy.read_file("pending.txt"), b"pending")
+        self.assertEqual(copy.modified_entries["pending.txt"].content, b"pending")
+        self.assertIsNone(copy.observer)
+        self.assertIsNone(copy.on_auto_commit)
+        self.assertIsNotNone(archive.on_auto_commit)
+
+
+class TestEntryTable(unittest.TestCase):
+    def test_mapping(self):
+        table = EntryTable([("b", 10, 1), ("a", 20, 2), ("b", 30, 3)])
+
+        self.assertEqual(len(table), 2)
+        self.assertEqual(list(table), ["b", "a"])
+        self.assertEqual(table["b"], Entry("b", 30, 3))
+        self.assertIn("a", table)
+        self.assertNotIn("c", table)
+        self.assertNotIn("\u20ac", table)
+        self.assertIsNone(table.get("c"))
+        self.assertEqual(pickle.loads(pickle.dumps(table)), table)
+
+        items = table.items()
+        self.assertEqual(len(items), 2)
+        self.assertEqual(list(items), list(items))
+        self.assertEqual(items & {("a", Entry("a", 20, 2))}, {("a", Entry("a", 20, 2))})
+        self.assertIn(("b", Entry("b", 30, 3)), items)
+        self.assertEqual(len(table.values()), 2)
+        self.assertIn(Entry("a", 20, 2), table.values())
+
+    def test_growth(self):
+        table = EntryTable((str(x), x, x) for x in range(1000))
+        self.assertTrue(all(table[str(x)].position == x for x in range(1000)))
+
+
+@unittest.skipIf(vectorized.numpy is None, "NumPy is not installed")
+class TestVectorized(unittest.TestCase):
+    def pack(self, file_list, use_numpy, layout=None):
+        threshold = vectorized.NUMPY_THRESHOLD
+        vectorized.NUMPY_THRESHOLD = 0 if use_numpy else float("inf")
+        try:
+            archive = InMemoryArchive.empty()
+            data = io.BytesIO()
+            total_size = sum(size for _, size in file_list)
+            entries = archive._pack_file_list(
+                data, file_list, total_size, len(file_list), "BIGF", layout
+            )
+            data.seek(0)
+            return data.getvalue(), entries, archive._unpack(data)[0]
+        finally:
+            vectorized.NUMPY_THRESHOLD = threshold
+
+    def test_identical(self):
+        # small sizes put null bytes in the index before the name terminators
+        file_list = {
+            string_generator(random.randint(0, 40)): random.randint(0, 300) for _ in range(500)
+        }
+        file_list = sorted(file_list.items())
+
+        python_data, python_entries, python_unpacked = self.pack(file_list, False)
+        numpy_data, numpy_entries, numpy_unpacked = self.pack(file_list, True)
+
+        self.assertEqual(python_data, numpy_data)
+        self.assertEqual(dict(python_entries.items()), dict(numpy_entries.items()))
+        self.assertEqual(dict(python_unpacked.items()), dict(numpy_unpacked.items()))
+        self.assertEqual(dict(python_entries.items()), dict(python_unpacked.items()))
+
+        layout = random.sample(file_list, len(file_list))
+        python_data = self.pack(file_list, False, layout)[0]
+        numpy_data = self.pack(file_list, True, layout)[0]
+        self.assertEqual(python_data, numpy_data)
+
+    def test_duplicates(self):
+        data = self.pack([("a", 1), ("b", 2), ("a", 3)], False)[0]
+        vectorized.NUMPY_THRESHOLD, threshold = 0, vectorized.NUMPY_THRESHOLD
+        try:
+            entries = InMemoryArchive(data).entries
+        finally:
+            vectorized.NUMPY_THRESHOLD = threshold
+
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries["a"].size, 3)
+
+
+class TestArchiveWriter(unittest.TestCase):
+    class Pipe:
+        """Non seekable sink"""
+
+        def __init__(self):
+            self.chunks = []
+
+        def write(self, data):
+            self.chunks.append(bytes(data))
+
+    def test_stream(self):
+        files = {"b.txt": b"b" * 3000000, "a.txt": b"aaa", "c\\d.txt": b""}
+        expected = InMemoryArchive.empty()
+        for name, content in files.items():
+            expected.add_file(name, content)
+
+        pipe = self.Pipe()
+        file_list = [(name, len(content)) for name, content in files.items()]
+        with ArchiveWriter(pipe, file_list) as writer:
+            self.assertEqual(writer.remaining, ["a.txt", "b.txt", "c\\d.txt"])
+            writer.write_entry("a.txt", b"aaa")
+            writer.write_entry("b.txt", io.BytesIO(files["b.txt"]))
+            writer.write_entry("c\\d.txt", [])
+
+        self.assertEqual(b"".join(pipe.chunks), expected.bytes())
+        self.assertEqual(dict(writer.entries.items()), dict(expected.entries.items()))
+
+    def test_errors(self):
+        writer = ArchiveWriter(self.Pipe(), [("a.txt", 3), ("b.txt", 1)])
+        with self.assertRaises(ValueError):
+            writer.write_entry("b.txt", b"b")
+        with self.assertRaises(ValueError):
+            writer.write_entry("a.txt", [b"aa", b"aa"])
+        with self.assertRaises(ValueError):
+            writer.close()
+
+
+class TestIterArchive(unittest.TestCase):
+    class Pipe:
+        """Non seekable source returning short reads"""
+
+        def __init__(self, data):
+            self.data = data
+            self.offset = 0
+
+        def read(self, size):
+            chunk = self.data[self.offset : self.offset + min(size, 7)]
+            self.offset += len(chunk)
+            return chunk
+
+    def test_stream(self):
+        with open("tests/test_data/test_big.big", "rb") as f:
+            data = f.read()
+
+        archive = InMemoryArchive(data)
+        files = {name: b"".join(chunks) for name, chunks in iter_archive(self.Pipe(data))}
+        self.assertEqual(files, {name: archive.read_file(name) for name in archive.file_list()})
+
+    def test_gaps_and_overlaps(self):
+        entries = [("a", 60, 10), ("b", 65, 3), ("c", 75, 5), ("d", 55, 10)]
+        header = b"BIG4" + b"\x00" * 4 + b"\x00\x00\x00\x04\x00\x00\x00\x3c"
+        index = b"".join(
+            position.to_bytes(4, "big") + size.to_bytes(4, "big") + name.encode() + b"\x00"
+            for name, position, size in entries
+        )
+        data = header + index
+        data += b"\x00" * (55 - len(data)) + bytes(range(55, 80))
+
+        stream = iter_archive(self.Pipe(data), chunk_size=4)
+        files = [(name, b"".join(chunks)) for name, chunks in stream]
+        self.assertEqual(
+            files,
+            [
+                (name, data[position : position + size])
+                for name, position, size in sorted(entries, key=lambda entry: entry[1])
+            ],
+        )
+
+        # unconsumed files are skipped
+        names = [name for name, _ in iter_archive(self.Pipe(data), chunk_size=4)]
+        self.assertEqual(names, ["d", "a", "b", "c"])
+
+    def test_truncated(self):
+        with open("tests/test_data/test_big.big", "rb") as f:
+            data = f.read()
+
+        with self.assertRaises(ValueError):
+            for _, chunks in iter_archive(self.Pipe(data[:-1])):
+                b"".join(chunks)
+
+
+class TestMergeArchives(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, True)
+
+    def test_merge(self):
+        first = InMemoryArchive.empty("BIGF")
+        first.add_file("a.txt", b"first a")
+        first.add_file("b.txt", b"first b" * 1000)
+        first.repack()
+        first.add_file("pending.txt", b"pending")
+
+        path = os.path.join(self.tmp_dir, "second.big")
+        second = InDiskArchive.empty(file_path=path)
+        second.add_file("b.txt", b"second b" * 1000)
+        second.add_file("c.txt", b"second c")
+        second.save()
+
+        dest = os.path.join(self.tmp_dir, "merged.big")
+        merged = merge_archives([first, path], dest)
+        self.assertEqual(merged.header, "BIGF")
+        self.assertEqual(
+            merged.read_files(merged.file_list()),
+            {
+                "a.txt": b"first a",
+                "b.txt": b"second b" * 1000,
+                "c.txt": b"second c",
+                "pending.txt": b"pending",
+            },
+        )
+        self.assertEqual(InDiskArchive(dest).entries, merged.entries)
+
+        merged = merge_archives([first, path], dest, conflict="first")
+        self.assertEqual(merged.read_file("b.txt"), b"first b" * 1000)
+
+        with self.assertRaises(KeyError):
+            merge_archives([first, path], dest, conflict="error")
+        with self.assertRaises(ValueError):
+            merge_archives([first, path], path)
+
+    def test_copy_range(self):
+        path = os.path.join(self.tmp_dir, "source")
+        data = os.urandom(3 * 1024 * 1024)
+        with open(path, "wb") as f:
+            f.write(data)
+
+        output = io.BytesIO()
+        with open(path, "rb") as f:
+            copy_range(f, output, 10, len(data) - 20)
+            with self.assertRaises(ValueError):
+                copy_range(f, output, len(data) - 5, 10)
+        self.assertEqual(output.getvalue()[: len(data) - 20], data[10:-10])
+
+        output_path = os.path.join(self.tmp_dir, "output")
+        with open(path, "rb") as f, open(output_path, "wb") as out:
+            out.write(b"header")
+            copy_range(f, out, 10, len(data) - 20)
+            out.write(b"footer")
+        with open(output_path, "rb") as f:
+            self.assertEqual(f.read(), b"header" + data[10:-10] + b"footer")
+
+
+class TestVolumes(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, True)
+
+    def test_save_and_open(self):
+        archive = InMemoryArchive.empty()
+        values = {}
+        for directory, count in [("big", 6), ("small", 2), ("other", 3)]:
+            for x in range(count):
+                values[f"data\\{directory}\\{x}.bin"] = os.urandom(100)
+        for name, content in values.items():
+            archive.add_file(name, content)
+        archive.repack()
+        archive.add_file("data\\pending.bin", b"pending")
+        values["data\\pending.bin"] = b"pending"
+
+        path = os.path.join(self.tmp_dir, "test.big")
+        paths = archive.save_volumes(path, max_size=1000)
+        self.assertEqual(paths, [os.path.join(self.tmp_dir, f"test_00{x}.big") for x in (1, 2)])
+
+        directories = []
+        for volume_path in paths:
+            self.assertLessEqual(os.path.getsize(volume_path), 1000)
+            volume = InDiskArchive(volume_path)
+            directories.append({name.rpartition("\\")[0] for name in volume.file_list()})
+        # directories are never split, the largest one is placed first
+        self.assertIn("data\\big", directories[0])
+        self.assertFalse(directories[0] & directories[1])
+
+        volumes = open_volume_set(path)
+        self.assertEqual(volumes.file_list(), sorted(values))
+        self.assertEqual(volumes.read_files(values), values)
+        self.assertEqual(volumes.read_file("data\\pending.bin"), b"pending")
+        self.assertEqual(archive.modified_entries.keys(), {"data\\pending.bin"})
+
+        # numbers are compared as integers, not as text
+        for name in ("test_999.big", "test_1000.big", "test_1x.big"):
+            shutil.copy(paths[0], os.path.join(self.tmp_dir, name))
+        volumes = open_volume_set(path)
+        self.assertEqual(
+            [os.path.basename(volume.file_path) for volume in volumes.volumes],
+            ["test_001.big", "test_002.big", "test_999.big", "test_1000.big"],
+        )
+
+        with self.assertRaises(base_archive.MaxSizeError):
+            archive.save_volumes(path, max_size=100)
+        with self.assertRaises(ValueError):
+            open_volume_set(os.path.join(self.tmp_dir, "missing.big"))
+
+
+class TestAsyncArchive(unittest.IsolatedAsyncioTestCase):
+    async def test_read_and_write(self):
+        async with AsyncArchive(InMemoryArchive.empty()) as archive:
+            await archive.add_file(TEST_FILE, TEST_CONTENT.encode(TEST_ENCODING))
+            repack = asyncio.ensure_future(archive.repack())
+            contents = await asyncio.gather(*[archive.read_file(TEST_FILE) for _ in range(10)])
+            await repack
+
+            self.assertEqual(contents, [TEST_CONTENT.encode(TEST_ENCODING)] * 10)
+            self.assertEqual(archive.archive.modified_entries, {})
+            self.assertEqual(await archive.file_list(), [TEST_FILE])
+
+    async def test_exit_off_loop(self):
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.ensure_future(tick())
+        async with AsyncArchive(InMemoryArchive.empty()) as archive:
+            archive._executor.submit(time.sleep, 0.2)
+            ticks.clear()
+        ticker.cancel()
+
+        self.assertGreater(len(ticks), 2)
+
+    async def test_auto_commit_off_loop(self):
+        path = os.path.join(tempfile.mkdtemp(), "test.big")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), True)
+        threads = []
+        large = InDiskArchive.empty(
+            file_path=path,
+            auto_commit_bytes=10,
+            on_auto_commit=lambda archive, size: threads.append(threading.current_thread()),
+        )
+
+        async with AsyncArchive(large) as archive:
+            await archive.add_file("data\\a.bin", b"a" * 20)
+            await archive.rename_file("data\\a.bin", "data\\b.bin")
+
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
+        self.assertEqual(large.file_list(), ["data\\b.bin"])
+
 
 class TestRefPack(unittest.TestCase):
     def test_refpack_check_valid_data(self):
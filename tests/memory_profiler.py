@@ -0,0 +1,197 @@
+"""Peak and retained memory of archive operations.
+
+Run from the root directory:
+    python -m tests.memory_profiler --sizes 1000000 10000000 --output memory.json
+
+Peak and retained memory are measured with tracemalloc, relative to the memory
+allocated before the operation started. The resident set size is sampled in a
+background thread where /proc is available, it includes memory not allocated
+through Python such as the page cache of memory mapped files.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional
+
+from pyBIG import InDiskArchive, InMemoryArchive, merge_archives
+
+MemoryProfile = namedtuple("MemoryProfile", "peak retained rss_peak")
+
+FILE_SIZE = 50_000
+
+
+def _current_rss() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class RSSSampler:
+    """Sample the resident set size in a background thread and keep the peak"""
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.start_rss = _current_rss()
+        self.peak = self.start_rss
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = _current_rss()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        if self.start_rss is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        if self.start_rss is not None:
+            self._stop.set()
+            self._thread.join()
+
+    @property
+    def peak_delta(self) -> Optional[int]:
+        if self.start_rss is None:
+            return None
+
+        return self.peak - self.start_rss
+
+
+def profile_memory(func: Callable[[], object]) -> MemoryProfile:
+    """Run func and measure how much memory it allocated at its peak and how
+    much was still allocated once it returned. The return value of func is
+    discarded before measuring retained memory.
+    """
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        with RSSSampler() as sampler:
+            func()
+
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return MemoryProfile(peak - start, current - start, sampler.peak_delta)
+
+
+def generate_files(directory: str, size: int, seed: int = 0) -> Dict[str, int]:
+    """Fill a directory with random files totalling roughly size bytes"""
+    rng = random.Random(seed)
+    files = {}
+    for index in range(max(size // FILE_SIZE, 1)):
+        name = f"dir{index % 13}/file{index}.bin"
+        path = os.path.join(directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(rng.getrandbits(FILE_SIZE * 8).to_bytes(FILE_SIZE, "little"))
+        files[name.replace("/", "\\")] = FILE_SIZE
+
+    return files
+
+
+def profile_operations(size: int, tmp_dir: str) -> Dict[str, Dict[str, MemoryProfile]]:
+    """Profile the memory heavy operations of both archive classes on an
+    archive of roughly size bytes.
+    """
+    source = os.path.join(tmp_dir, "source")
+    path = os.path.join(tmp_dir, "archive.big")
+    output = os.path.join(tmp_dir, "output.big")
+    files = generate_files(source, size)
+    edited = next(iter(files))
+
+    results = {
+        "InMemoryArchive": {
+            "from_directory": profile_memory(lambda: InMemoryArchive.from_directory(source)),
+        },
+        "InDiskArchive": {
+            "from_directory": profile_memory(
+                lambda: InDiskArchive.from_directory(source, file_path=path)
+            ),
+        },
+    }
+
+    with open(path, "rb") as f:
+        archive = InMemoryArchive(f.read())
+
+    for name, operation in [
+        ("repack", archive.repack),
+        ("save", lambda: archive.save(output)),
+        ("bytes", archive.bytes),
+        ("snapshot", archive.snapshot),
+    ]:
+        archive.edit_file(edited, b"edited")
+        results["InMemoryArchive"][name] = profile_memory(operation)
+
+    results["InDiskArchive"]["merge"] = profile_memory(
+        lambda: merge_archives([path], os.path.join(tmp_dir, "merged.big"))
+    )
+
+    archive = InDiskArchive(path)
+    results["InDiskArchive"]["extract"] = profile_memory(
+        lambda: archive.extract(os.path.join(tmp_dir, "extracted"))
+    )
+
+    for name, operation in [
+        ("repack", archive.repack),
+        ("save", archive.save),
+        ("bytes", archive.bytes),
+    ]:
+        archive.edit_file(edited, b"edited")
+        results["InDiskArchive"][name] = profile_memory(operation)
+
+    return results
+
+
+def run(sizes: List[int]) -> dict:
+    report = {"python": sys.version, "archives": []}
+    for size in sizes:
+        tmp_dir = tempfile.mkdtemp(prefix="pyBIG-memory-")
+        try:
+            results = profile_operations(size, tmp_dir)
+            report["archives"].append(
+                {
+                    "size": size,
+                    "results": {
+                        cls: {name: profile._asdict() for name, profile in operations.items()}
+                        for cls, operations in results.items()
+                    },
+                }
+            )
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Profile the memory usage of pyBIG")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--output", help="File to write the JSON results to, defaults to stdout")
+    args = parser.parse_args(argv)
+
+    report = run(args.sizes)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
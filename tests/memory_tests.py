@@ -1,10 +1,15 @@
 import os
+import shutil
 import sys
+import tempfile
 import unittest
 from gc import get_referents
 from types import FunctionType, ModuleType
 
 from pyBIG import InDiskArchive, InMemoryArchive
+from pyBIG.entry_table import Entry, EntryTable
+
+from .memory_profiler import profile_operations
 
 # Custom objects know their class.
 # Function objects seem to know way too much, including modules.
@@ -62,6 +67,53 @@ class MemoryTests(unittest.TestCase):
 
         assert post_save_size == loaded_size
 
+    def test_entry_table(self):
+        entries = [(f"data\\ini\\object\\file{x}.ini", x * 1000, 1000) for x in range(10000)]
+
+        table = EntryTable(entries)
+        as_dict = {name: Entry(name, position, size) for name, position, size in entries}
+
+        self.assertEqual(dict(table.items()), as_dict)
+        assert getsize(table) * 3 < getsize(as_dict)
+
+
+# Peak memory allowed for each operation, as a multiple of the archive size
+BUDGETS = {
+    "InMemoryArchive": {
+        "from_directory": 2.2,
+        "repack": 1.2,
+        "save": 1.2,
+        "bytes": 1.2,
+        "snapshot": 0.01,
+    },
+    "InDiskArchive": {
+        "from_directory": 1.2,
+        "repack": 0.1,
+        "save": 0.1,
+        "bytes": 1.2,
+        "merge": 0.05,
+        "extract": 0.05,
+    },
+}
+# Allocations that do not scale with the size of the archive
+BUDGET_OVERHEAD = 256 * 1024
+
+
+class MemoryBudgetTests(unittest.TestCase):
+    def test_budgets(self):
+        for size in [2_000_000, 8_000_000]:
+            tmp_dir = tempfile.mkdtemp()
+            try:
+                results = profile_operations(size, tmp_dir)
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+            for cls, operations in BUDGETS.items():
+                for operation, budget in operations.items():
+                    with self.subTest(size=size, cls=cls, operation=operation):
+                        peak = results[cls][operation].peak
+                        self.assertLessEqual(peak, size * budget + BUDGET_OVERHEAD)
+
 
 if __name__ == "__main__":
     # python -m unittest